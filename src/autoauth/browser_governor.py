@@ -0,0 +1,401 @@
+import os
+import shutil
+import signal
+import logging
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from exceptions import BrowserResourceError
+
+# 設定 logger
+logger = logging.getLogger(__name__)
+
+PROC_DIR = Path("/proc")
+PROFILE_PREFIX = "autoauth-chrome-"
+# 強制結束瀏覽器前，最多等 before_kill 幾秒
+BEFORE_KILL_TIMEOUT = 10
+# 送出 SIGKILL 後，最多等幾秒回收自己的子行程
+REAP_TIMEOUT = 5
+
+
+def read_process_table():
+    """
+    讀取 /proc 取得所有行程的資訊
+
+    Returns:
+        dict: pid -> (名稱, 狀態, ppid, rss bytes)，沒有 /proc 的系統回傳空的 dict
+    """
+    processes = {}
+    if not PROC_DIR.is_dir():
+        return processes
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in PROC_DIR.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            # 行程在讀取途中結束
+            continue
+        # 行程名稱可能包含空白，從最後一個右括號之後才開始切欄位
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        processes[int(entry.name)] = (name, fields[0], int(fields[1]), int(fields[21]) * page_size)
+    return processes
+
+
+def read_cmdline(pid):
+    """讀取行程的命令列參數，行程已經結束或沒有權限時回傳空的 list"""
+    try:
+        return (PROC_DIR / str(pid) / "cmdline").read_bytes().decode(errors="replace").split("\0")
+    except OSError:
+        return []
+
+
+def get_profile_dir(cmdline):
+    """從 Chrome 的命令列參數找出由 governor 建立的 profile 目錄，不是的話回傳 None"""
+    prefix = f"--user-data-dir={Path(tempfile.gettempdir()) / PROFILE_PREFIX}"
+    for arg in cmdline:
+        if arg.startswith(prefix):
+            return arg[len("--user-data-dir="):]
+    return None
+
+
+def get_profile_owner(profile_dir):
+    """從 profile 目錄名稱取得建立它的 worker pid"""
+    return int(Path(profile_dir).name[len(PROFILE_PREFIX):].split("-")[0])
+
+
+def get_process_tree(root_pid, processes):
+    """找出 root_pid 和它所有子孫行程的 pid，沒有 /proc 的系統只回傳 root_pid"""
+    if not processes:
+        return {root_pid}
+
+    children = {}
+    for pid, (_, _, ppid, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    tree, stack = set(), [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in tree or pid not in processes:
+            continue
+        tree.add(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def pid_alive(pid):
+    """檢查行程是否還活著"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def kill_processes(pids):
+    """強制結束行程，並回收是自己子行程的殭屍行程"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            continue
+
+    # SIGKILL 不會馬上生效，等行程真的結束才回收，最多等 REAP_TIMEOUT 秒
+    deadline = time.monotonic() + REAP_TIMEOUT
+    for pid in pids:
+        while True:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                    break
+            except ChildProcessError:
+                # 不是自己的子行程，交給它的父行程回收
+                break
+            if time.monotonic() >= deadline:
+                logger.warning(f"行程 {pid} 在 {REAP_TIMEOUT} 秒內沒有結束，留給定期清理回收")
+                break
+            time.sleep(0.01)
+
+
+def reap_zombies():
+    """
+    回收所有已經結束的子行程
+
+    在容器裡沒有 init 時，本程式是 PID 1，Chrome 的輔助行程結束後會被過繼給自己，
+    不回收就會一直留著成為殭屍行程
+
+    Returns:
+        int: 回收的行程數
+    """
+    reaped = 0
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        reaped += 1
+    return reaped
+
+
+class BrowserGovernor:
+    """
+    管理 Chrome/chromedriver 的資源
+
+    - 追蹤每個瀏覽器的行程樹與暫存 profile
+    - 限制每次操作的執行時間與記憶體，超過就直接砍掉整棵行程樹
+    - 清理上次執行留下來的孤兒行程和 profile
+
+    Args:
+        max_action_seconds: 每次操作最多可以執行幾秒
+        max_rss_mb: 每次操作的瀏覽器行程樹最多可以用多少 MB 記憶體
+        poll_interval: 檢查限制的間隔秒數
+    """
+
+    def __init__(self, max_action_seconds=300, max_rss_mb=1024, poll_interval=1.0):
+        self.max_action_seconds = max_action_seconds
+        self.max_rss_mb = max_rss_mb
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        # chromedriver pid -> profile 目錄
+        self._browsers = {}
+        # profile 目錄 -> 建立它的執行緒，讓多個執行緒同時操作時各自只管自己的瀏覽器
+        self._profiles = {}
+        self._owners = {}
+        self._reaper = None
+
+    @classmethod
+    def from_env(cls):
+        """從環境變數建立 BrowserGovernor"""
+        return cls(
+            max_action_seconds=int(os.getenv("BROWSER_ACTION_TIMEOUT", 300)),
+            max_rss_mb=int(os.getenv("BROWSER_MAX_RSS_MB", 1024)),
+        )
+
+    def new_profile_dir(self):
+        """建立一個由 governor 管理的 Chrome profile 目錄"""
+        # 目錄名稱帶上 pid，同一台機器上有多個 worker 時才不會清掉別人的 profile
+        # 建立和登記在同一個鎖裡完成，reaper 才不會看到建立了但還沒登記的 profile
+        with self._lock:
+            profile_dir = tempfile.mkdtemp(prefix=f"{PROFILE_PREFIX}{os.getpid()}-")
+            self._profiles[profile_dir] = threading.get_ident()
+        return profile_dir
+
+    def browser_env(self, profile_dir):
+        """
+        啟動 chromedriver 用的環境變數
+
+        把暫存目錄指到 profile 底下，Chrome 自己建立的暫存檔會跟 profile 一起被清掉，
+        不需要去碰系統暫存目錄裡其他程式的 Chrome 資料夾
+        """
+        tmp_dir = Path(profile_dir) / "tmp"
+        tmp_dir.mkdir(exist_ok=True)
+        return {**os.environ, "TMPDIR": str(tmp_dir)}
+
+    def track(self, driver, profile_dir=None):
+        """開始追蹤一個 WebDriver 的行程樹"""
+        pid = driver.service.process.pid
+        with self._lock:
+            self._browsers[pid] = profile_dir
+            self._owners[pid] = threading.get_ident()
+        logger.debug(f"追蹤瀏覽器 chromedriver pid={pid}")
+
+    def release(self, pid):
+        """砍掉瀏覽器殘留的行程並刪除它的 profile"""
+        kill_processes(get_process_tree(pid, read_process_table()))
+        with self._lock:
+            profile_dir = self._browsers.pop(pid, None)
+            self._owners.pop(pid, None)
+            self._profiles.pop(profile_dir, None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+    def _tracked_pids(self, processes):
+        with self._lock:
+            roots = list(self._browsers)
+        pids = set()
+        for root in roots:
+            pids |= get_process_tree(root, processes)
+        return pids
+
+    def stats(self):
+        """
+        取得目前瀏覽器的數量和記憶體用量
+
+        Returns:
+            dict: browsers 為追蹤中的瀏覽器數量，rss_mb 為它們行程樹的總記憶體
+        """
+        processes = read_process_table()
+        rss = sum(processes[pid][3] for pid in self._tracked_pids(processes) if pid in processes)
+        with self._lock:
+            browsers = len(self._browsers)
+        return {"browsers": browsers, "rss_mb": rss / 1024 / 1024}
+
+    @contextmanager
+    def action(self, name, before_kill=None):
+        """
+        限制一次瀏覽器操作的執行時間和記憶體
+
+        在這個區塊內由目前執行緒 track 的瀏覽器會被監控，超過限制時整棵行程樹會被砍掉，
+        區塊結束時不論成功與否都會清掉殘留的行程和 profile。
+
+        Args:
+            name: 操作名稱
+            before_kill: 砍掉行程樹之前呼叫，參數為超過限制的原因，
+                瀏覽器卡住時最多等 BEFORE_KILL_TIMEOUT 秒
+
+        Raises:
+            BrowserResourceError: 操作超過時間或記憶體限制
+        """
+        owner = threading.get_ident()
+        violation = []
+        done = threading.Event()
+        start = time.monotonic()
+
+        def run_before_kill():
+            try:
+                before_kill(violation[0])
+            except Exception as e:
+                logger.error(f"強制結束瀏覽器前的處理發生錯誤: {e}")
+
+        def watch():
+            while not done.wait(self.poll_interval):
+                with self._lock:
+                    roots = [pid for pid, ident in self._owners.items() if ident == owner]
+                processes = read_process_table()
+                pids = set()
+                for root in roots:
+                    pids |= get_process_tree(root, processes)
+                rss_mb = sum(processes[pid][3] for pid in pids if pid in processes) / 1024 / 1024
+
+                elapsed = time.monotonic() - start
+                if elapsed > self.max_action_seconds:
+                    violation.append(f"{name} 執行超過 {self.max_action_seconds} 秒")
+                elif rss_mb > self.max_rss_mb:
+                    violation.append(f"{name} 記憶體用量 {rss_mb:.0f} MB 超過 {self.max_rss_mb} MB")
+                else:
+                    continue
+
+                if before_kill is not None:
+                    hook = threading.Thread(target=run_before_kill, name=f"governor-{name}-before-kill", daemon=True)
+                    hook.start()
+                    hook.join(BEFORE_KILL_TIMEOUT)
+                logger.error(f"{violation[0]}，強制結束 {len(pids)} 個瀏覽器行程")
+                kill_processes(pids)
+                return
+
+        watchdog = threading.Thread(target=watch, name=f"governor-{name}", daemon=True)
+        watchdog.start()
+        try:
+            yield
+        except Exception as e:
+            if violation:
+                raise BrowserResourceError(violation[0]) from e
+            raise
+        finally:
+            done.set()
+            watchdog.join()
+            with self._lock:
+                leftover = [pid for pid, ident in self._owners.items() if ident == owner]
+            for pid in leftover:
+                self.release(pid)
+            # 瀏覽器沒有成功啟動時，profile 不會被 track 到
+            with self._lock:
+                untracked = [path for path, ident in self._profiles.items() if ident == owner]
+                for profile_dir in untracked:
+                    del self._profiles[profile_dir]
+            for profile_dir in untracked:
+                shutil.rmtree(profile_dir, ignore_errors=True)
+        if violation:
+            raise BrowserResourceError(violation[0])
+
+    def reap_orphans(self):
+        """
+        清理沒有被追蹤的 Chrome/chromedriver 行程和 profile 目錄
+
+        只會清理命令列帶有 governor 建立的 profile（--user-data-dir=<暫存目錄>/autoauth-chrome-*）的
+        Chrome 行程樹和啟動它的 chromedriver，而且 profile 必須不在使用中，
+        並且是自己或已經結束的 worker 建立的。使用者自己開的 Chrome 和其他 worker 的瀏覽器不會被清掉。
+
+        Returns:
+            tuple: (清掉的行程數, 清掉的目錄數)
+        """
+        def is_orphaned(profile_dir):
+            # 每次都查目前的 profile，掃描途中其他執行緒才建立的 profile 也不會被當成孤兒
+            with self._lock:
+                if profile_dir in self._profiles:
+                    return False
+            owner_pid = get_profile_owner(profile_dir)
+            return owner_pid == os.getpid() or not pid_alive(owner_pid)
+
+        processes = read_process_table()
+        tracked = self._tracked_pids(processes)
+        uid = os.getuid()
+
+        orphans = set()
+        for pid, (_, _, ppid, _) in processes.items():
+            if pid in tracked or pid in orphans:
+                continue
+            try:
+                if (PROC_DIR / str(pid)).stat().st_uid != uid:
+                    continue
+                profile_dir = get_profile_dir(read_cmdline(pid))
+                if profile_dir is None or not is_orphaned(profile_dir):
+                    continue
+            except (ValueError, OSError):
+                continue
+            # chromedriver 的命令列沒有 profile，從它啟動的 Chrome 往上找
+            root = pid
+            if ppid in processes and processes[ppid][0].startswith("chromedriver") and ppid not in tracked:
+                root = ppid
+            orphans |= get_process_tree(root, processes)
+        kill_processes(orphans)
+
+        removed = 0
+        for path in Path(tempfile.gettempdir()).glob(f"{PROFILE_PREFIX}*"):
+            try:
+                if not is_orphaned(str(path)):
+                    continue
+            except ValueError:
+                continue
+            # 刪除前在鎖裡再確認一次，避免刪掉剛被 new_profile_dir 建立的同名 profile
+            with self._lock:
+                if str(path) in self._profiles:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+
+        if orphans or removed:
+            logger.info(f"清理了 {len(orphans)} 個孤兒瀏覽器行程和 {removed} 個暫存目錄")
+        return len(orphans), removed
+
+    def start_reaper(self, interval=600):
+        """在背景定期清理孤兒行程和 profile 目錄"""
+        if self._reaper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap_orphans()
+                    reaped = reap_zombies()
+                    if reaped:
+                        logger.info(f"回收了 {reaped} 個已結束的子行程")
+                    stats = self.stats()
+                    logger.debug(f"目前有 {stats['browsers']} 個瀏覽器，使用 {stats['rss_mb']:.0f} MB 記憶體")
+                except Exception as e:
+                    logger.error(f"清理孤兒瀏覽器時發生錯誤: {e}")
+
+        self._reaper = threading.Thread(target=run, name="governor-reaper", daemon=True)
+        self._reaper.start()
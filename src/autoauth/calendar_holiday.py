@@ -2,14 +2,14 @@ import re
 import requests
 import logging
 
-from typing import List
+from typing import List, Optional
 from icalendar import Calendar
 from datetime import datetime, date, timedelta
 
 # 設定 logger
 logger = logging.getLogger(__name__)
 
-def get_nycu_calendar_holidays(year=None, month=None) -> List[str]:
+def get_nycu_calendar_holidays(year=None, month=None) -> Optional[List[str]]:
     """
     使用 iCal 格式獲取陽明交通大學行事曆中的放假日
     
@@ -18,7 +18,7 @@ def get_nycu_calendar_holidays(year=None, month=None) -> List[str]:
         month: 月份，默認為當前月份
         
     Returns:
-        dict: 包含放假日期及原因的字典
+        list: 放假日期字串，無法取得行事曆時回傳 None（和沒有放假的空 list 區分）
     """
     # 如果未指定年月，使用當前年月
     if year is None or month is None:
@@ -115,7 +115,7 @@ def get_nycu_calendar_holidays(year=None, month=None) -> List[str]:
     
     except Exception as e:
         logger.error(f"獲取行事曆時發生錯誤: {e}")
-        return []
+        return None
     
 def check_weekend(date: datetime) -> bool:
     """
@@ -127,6 +127,8 @@ def check_weekend(date: datetime) -> bool:
 # 測試函數
 if __name__ == "__main__":
     holidays = get_nycu_calendar_holidays()
+    if holidays is None:
+        raise SystemExit("無法取得行事曆")
     print("本月放假日:")
     for date in holidays:
         print(f"{date}")
\ No newline at end of file
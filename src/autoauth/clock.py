@@ -0,0 +1,149 @@
+import time
+import heapq
+import itertools
+import threading
+
+from datetime import datetime, timedelta
+
+
+class SimulationFinished(BaseException):
+    """虛擬時鐘走到模擬結束時間，繼承 BaseException 避免被排程中的 except Exception 吞掉"""
+    pass
+
+
+class ClockStopped(BaseException):
+    """時鐘被要求停止，用來中斷正在等待的排程"""
+    pass
+
+
+class SystemClock:
+    """使用系統時間的時鐘"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class StoppableClock(SystemClock):
+    """可以從其他執行緒中斷 sleep 的系統時鐘，停止後 sleep 會拋出 ClockStopped"""
+
+    def __init__(self):
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def sleep(self, seconds: float):
+        if self._stopped.wait(max(seconds, 0)):
+            raise ClockStopped("排程已停止")
+
+
+class VirtualClock:
+    """
+    模擬用的虛擬時鐘，sleep 只會把時間往前推，不會真的等待
+
+    Args:
+        start: 模擬開始時間
+        end: 模擬結束時間，時間超過後 sleep 會拋出 SimulationFinished
+    """
+
+    def __init__(self, start: datetime, end: datetime = None):
+        self.current = start
+        self.end = end
+
+    def now(self) -> datetime:
+        return self.current
+
+    def sleep(self, seconds: float):
+        self.current += timedelta(seconds=max(seconds, 0))
+        if self.end is not None and self.current >= self.end:
+            raise SimulationFinished(f"模擬時間已到 {self.end}")
+
+
+class VirtualTimeline:
+    """
+    多個排程共用的虛擬時間軸
+
+    每個排程在自己的執行緒中執行（和 sharding 每個帳號一個執行緒相同），
+    但同一時間只有一個排程在跑：排程呼叫 sleep 時讓出執行權，
+    時間軸再依照喚醒時間先後叫醒下一個排程，所以結果是固定的。
+
+    Args:
+        start: 模擬開始時間
+        end: 模擬結束時間，時間到了之後所有排程的 sleep 都會拋出 SimulationFinished
+    """
+
+    def __init__(self, start: datetime, end: datetime):
+        self.current = start
+        self.end = end
+        self.finished = False
+        self._threads = []
+        # (喚醒時間, 順序, 等待喚醒的 Event)
+        self._waiting = []
+        self._order = itertools.count()
+        self._yielded = threading.Event()
+
+    def spawn(self, target, name=None):
+        """加入一個排程，target 會拿到這個時間軸的時鐘作為參數"""
+        clock = TimelineClock(self)
+        wake = threading.Event()
+
+        def run():
+            wake.wait()
+            try:
+                target(clock)
+            except SimulationFinished:
+                pass
+            finally:
+                self._yielded.set()
+
+        self._threads.append(threading.Thread(target=run, name=name, daemon=True))
+        heapq.heappush(self._waiting, (self.current, next(self._order), wake))
+
+    def _wait(self, seconds: float):
+        """由排程的執行緒呼叫，讓出執行權直到時間軸走到喚醒時間"""
+        wake = threading.Event()
+        heapq.heappush(self._waiting, (self.current + timedelta(seconds=max(seconds, 0)), next(self._order), wake))
+        self._yielded.set()
+        wake.wait()
+        if self.finished:
+            raise SimulationFinished(f"模擬時間已到 {self.end}")
+
+    def run(self):
+        """依照時間先後執行所有排程，直到結束時間"""
+        for thread in self._threads:
+            thread.start()
+
+        while self._waiting:
+            wake_time, _, wake = heapq.heappop(self._waiting)
+            if wake_time >= self.end:
+                # 讓剩下的排程從 sleep 拋出 SimulationFinished 結束
+                self.current = self.end
+                self.finished = True
+            else:
+                self.current = wake_time
+            self._yielded.clear()
+            wake.set()
+            self._yielded.wait()
+
+        for thread in self._threads:
+            thread.join()
+
+
+class TimelineClock:
+    """VirtualTimeline 上單一排程使用的時鐘"""
+
+    def __init__(self, timeline: VirtualTimeline):
+        self.timeline = timeline
+
+    def now(self) -> datetime:
+        return self.timeline.current
+
+    def sleep(self, seconds: float):
+        self.timeline._wait(seconds)
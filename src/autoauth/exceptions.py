@@ -25,6 +25,16 @@ class AttendanceException(BaseNYCUException):
     pass
 
 
+class BrowserResourceError(BaseNYCUException):
+    """處理瀏覽器超過執行時間或記憶體限制的錯誤"""
+    pass
+
+
+class LeaseLostError(BaseNYCUException):
+    """處理多個 worker 分配帳號時，帳號租約已經不屬於自己的錯誤"""
+    pass
+
+
 # 更詳細的例外類別
 class CredentialsError(LoginException):
     """處理憑證相關錯誤，如缺少用戶名或密碼"""
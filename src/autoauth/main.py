@@ -1,12 +1,13 @@
 import os
 import dotenv
 import logging
-import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from calendar_holiday import get_nycu_calendar_holidays, check_weekend
-from nycu_sign import handle_singin_singout
+from clock import SystemClock
+from exceptions import CredentialsError
+from nycu_sign import handle_singin_singout, browser_governor
+from planner import build_monthly_plan
 
 # 載入環境變數
 dotenv.load_dotenv()
@@ -30,35 +31,25 @@ logger = logging.getLogger(__name__)
 
 # 設定記錄目錄和環境變數
 RECORD_DIR = Path(os.getenv("RECORD_DIR", "./record"))
-RECORD_DIR.mkdir(parents=True, exist_ok=True)
 
 # 從 .env 獲取每月需要的時數和每月開始日期
 MONTHLY_REQUIRED_HOURS = int(os.getenv("MONTHLY_REQUIRED_HOURS", 20))  # 預設20小時
 MONTHLY_START_DAY = int(os.getenv("MONTHLY_START_DAY", 1))  # 預設每月1號開始
 
-def get_monthly_holidays(year, month):
-    """獲取指定月份的假期"""
-    return get_nycu_calendar_holidays(year, month)
+# 簽到/簽退失敗時從 RETRY_BASE_SECONDS 開始每次加倍等待，最多等 RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 30 * 60
+# 同一天的簽到最多嘗試幾次，避免帳號密碼錯誤時不停登入導致帳號被鎖
+MAX_SIGN_IN_ATTEMPTS = 5
 
-def is_workday(date_to_check):
-    """檢查是否為工作日（排除周末和假期）"""
-    if check_weekend(date_to_check):
-        logger.info(f"{date_to_check.strftime('%Y-%m-%d')} 是周末，不簽到")
-        return False
-    
-    holidays = get_monthly_holidays(date_to_check.year, date_to_check.month)
-    date_str = date_to_check.strftime("%Y-%m-%d")
-    if date_str in holidays:
-        logger.info(f"{date_str} 是假期，不簽到")
-        return False
-    
-    return True
-
-def record_attendance(action, timestamp):
+def record_attendance(action, timestamp, record_dir=None):
     """將簽到/簽退記錄寫入檔案"""
+    record_dir = record_dir or RECORD_DIR
     today = timestamp.date()
-    month_file = RECORD_DIR / f"{today.year}_{today.month}.txt"
+    month_file = record_dir / f"{today.year}_{today.month}.txt"
     
+    # 第一次寫入時才建立目錄，import 時不在目前目錄留下空的紀錄目錄
+    record_dir.mkdir(parents=True, exist_ok=True)
     with open(month_file, "a") as f:
         f.write(f"{timestamp.strftime('%Y-%m-%d %H:%M:%S')} {action}\n")
     logger.info(f"記錄 {action} 時間: {timestamp}")
@@ -81,51 +72,58 @@ def get_month_start_date(today=None):
         return start_date
     return start_date
 
-def get_total_hours(start_date=None):
+def get_total_hours(start_date=None, today=None, record_dir=None):
     """計算從本月開始日期到現在的總工作時數"""
     if start_date is None:
-        start_date = get_month_start_date()
+        start_date = get_month_start_date(today)
+    if today is None:
+        today = datetime.now().date()
+    record_dir = record_dir or RECORD_DIR
     
-    today = datetime.now().date()
-    month_file = RECORD_DIR / f"{today.year}_{today.month}.txt"
-    if not month_file.exists():
-        return 0
+    # 開始日期不是1號時，計算週期會跨越兩個月份的紀錄檔
+    lines = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (today.year, today.month):
+        month_file = record_dir / f"{year}_{month}.txt"
+        if month_file.exists():
+            with open(month_file, "r") as f:
+                lines.extend(f.readlines())
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
     
     total_hours = 0
-    with open(month_file, "r") as f:
-        lines = f.readlines()
-        sign_in_time = None
+    sign_in_time = None
+    
+    for line in lines:
+        if not line.strip():
+            continue
+            
+        parts = line.strip().split()
+        if len(parts) < 3:
+            continue
+            
+        log_date, log_time, action = parts[0], parts[1], parts[2]
+        log_datetime = datetime.strptime(f"{log_date} {log_time}", "%Y-%m-%d %H:%M:%S")
         
-        for line in lines:
-            if not line.strip():
-                continue
-                
-            parts = line.strip().split()
-            if len(parts) < 3:
-                continue
-                
-            log_date, log_time, action = parts[0], parts[1], parts[2]
-            log_datetime = datetime.strptime(f"{log_date} {log_time}", "%Y-%m-%d %H:%M:%S")
+        # 只計算本月開始日期之後的記錄
+        if log_datetime.date() < start_date:
+            continue
             
-            # 只計算本月開始日期之後的記錄
-            if log_datetime.date() < start_date:
-                continue
-                
-            if action == "SignIn":
-                sign_in_time = log_datetime
-            elif action == "SignOut" and sign_in_time:
-                work_duration = (log_datetime - sign_in_time).total_seconds() / 3600
-                total_hours += int(work_duration)
-                sign_in_time = None
+        if action == "SignIn":
+            sign_in_time = log_datetime
+        elif action == "SignOut" and sign_in_time:
+            work_duration = (log_datetime - sign_in_time).total_seconds() / 3600
+            total_hours += int(work_duration)
+            sign_in_time = None
     
     return total_hours
 
-def get_daily_hours(today=None):
+def get_daily_hours(today=None, record_dir=None):
     """計算今天已經記錄的工作時數"""
     if today is None:
         today = datetime.now().date()
+    record_dir = record_dir or RECORD_DIR
     
-    month_file = RECORD_DIR / f"{today.year}_{today.month}.txt"
+    month_file = record_dir / f"{today.year}_{today.month}.txt"
     if not month_file.exists():
         return 0
     
@@ -158,84 +156,189 @@ def get_daily_hours(today=None):
     
     return daily_hours
 
-def auto_check_in_out(check_in_hour=9, daily_work_hours=8):
-    """自動簽到和簽退，根據每月所需時數控制"""
+def get_last_sign_in(today=None, record_dir=None):
+    """
+    取得今天最後一次還沒有簽退的簽到時間
+
+    Returns:
+        datetime: 簽到時間，今天沒有未簽退的簽到時回傳 None
+    """
+    if today is None:
+        today = datetime.now().date()
+    record_dir = record_dir or RECORD_DIR
+    
+    month_file = record_dir / f"{today.year}_{today.month}.txt"
+    if not month_file.exists():
+        return None
+    
+    sign_in_time = None
+    today_str = today.strftime("%Y-%m-%d")
+    
+    with open(month_file, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) < 3 or parts[0] != today_str:
+                continue
+            
+            if parts[2] == "SignIn":
+                sign_in_time = datetime.strptime(f"{parts[0]} {parts[1]}", "%Y-%m-%d %H:%M:%S")
+            elif parts[2] == "SignOut":
+                sign_in_time = None
+    
+    return sign_in_time
+
+def sleep_until(clock, target, reason):
+    """等待到指定時間"""
+    wait_seconds = (target - clock.now()).total_seconds()
+    if wait_seconds > 0:
+        logger.info(f"{reason}，等待 {wait_seconds / 3600:.2f} 小時")
+        clock.sleep(wait_seconds)
+
+def get_retry_delay(failures):
+    """連續失敗 failures 次之後要等待幾秒再重試"""
+    return min(RETRY_BASE_SECONDS * 2 ** (failures - 1), RETRY_MAX_SECONDS)
+
+def get_plan(today, check_in_hour, daily_work_hours, record_dir=None, holiday_source=None):
+    """建立本月排程，並根據已記錄的工時決定從哪天開始排"""
+    month_start_date = get_month_start_date(today)
+    from_day = max(today, month_start_date)
+    return build_monthly_plan(
+        month_start_date, MONTHLY_START_DAY, MONTHLY_REQUIRED_HOURS,
+        daily_work_hours=daily_work_hours,
+        check_in_hour=check_in_hour,
+        done_hours=get_total_hours(month_start_date, today=from_day, record_dir=record_dir),
+        from_day=from_day,
+        today_hours=get_daily_hours(from_day, record_dir=record_dir),
+        holiday_source=holiday_source,
+    )
+
+def auto_check_in_out(check_in_hour=9, daily_work_hours=8, clock=None, sign_action=None,
+                      record_dir=None, holiday_source=None):
+    """
+    自動簽到和簽退，根據每月預先排好的排程控制
+
+    Args:
+        check_in_hour: 每天簽到的時間
+        daily_work_hours: 每天工作時數
+        clock: 提供 now() 和 sleep() 的時鐘，默認為系統時間
+        sign_action: 執行簽到/簽退的函數，參數為 ("SignIn" 或 "SignOut", 排程日期)，
+            回傳 False 代表這次操作不是由自己執行（已經由其他 worker 完成或狀態不明），不需要再記錄，
+            簽退回傳 False 時今天不再排程。默認為 handle_singin_singout
+        record_dir: 紀錄檔目錄，默認為 RECORD_DIR
+        holiday_source: 給定 (start_date, end_date) 回傳假期集合的函數，默認為行事曆，
+            無法取得時回傳 None，之後每天重新建立排程直到取得為止
+
+    Raises:
+        CredentialsError: 沒有設定帳號密碼
+    """
+    clock = clock or SystemClock()
+    sign_action = sign_action or (lambda action, day: handle_singin_singout(action=action))
+    
+    plan = None
+    plan_built_on = None
+    sign_in_failures = 0
     while True:
-        now = datetime.now()
+        now = clock.now()
         today = now.date()
         
-        # 檢查是否為工作日
-        if not is_workday(today):
-            logger.info("今天不是工作日，等待到明天...")
-            time.sleep(60 * 60)
-            continue
-        
-        # 計算本月開始日期
-        month_start_date = get_month_start_date(today)
+        # 進入新的計算週期時才重新建立排程，上次沒有取得行事曆的話每天重新建立一次
+        if plan is None or today > plan.end_date or (plan.provisional and today > plan_built_on):
+            plan = get_plan(today, check_in_hour, daily_work_hours, record_dir, holiday_source)
+            plan_built_on = today
         
         # 如果今天早於本月開始日期，等待到開始日期
-        if today < month_start_date:
-            wait_seconds = (datetime.combine(month_start_date, datetime.min.time()) - now).total_seconds()
-            logger.info(f"本月從 {month_start_date} 開始，等待 {int(wait_seconds / 3600)} 小時")
-            time.sleep(wait_seconds)
-            continue
-        
-        # 檢查本月是否已完成所需時數
-        total_hours = get_total_hours(month_start_date)
-        if total_hours >= MONTHLY_REQUIRED_HOURS:
-            logger.info(f"本月從 {month_start_date} 開始已完成 {total_hours} 小時，達到或超過 {MONTHLY_REQUIRED_HOURS} 小時，等待下個月")
-            next_month_start = (month_start_date.replace(day=MONTHLY_START_DAY) + timedelta(days=32)).replace(day=MONTHLY_START_DAY)
-            wait_seconds = (datetime.combine(next_month_start, datetime.min.time()) - now).total_seconds()
-            time.sleep(wait_seconds)
+        if today < plan.start_date:
+            sleep_until(clock, datetime.combine(plan.start_date, datetime.min.time()), f"本月從 {plan.start_date} 開始")
             continue
         
-        # 檢查今天是否已完成每日工時
-        daily_hours = get_daily_hours(today)
-        if daily_hours >= daily_work_hours:
-            logger.info(f"今天已完成 {daily_hours} 小時工作，等待到明天")
-            time.sleep(24 * 60 * 60)
+        slot = plan.slot_for(today)
+        if slot is None:
+            next_slot = plan.next_slot(today)
+            if next_slot is not None:
+                sleep_until(clock, next_slot.sign_in, f"今天沒有排程，下一次簽到在 {next_slot.sign_in}")
+            else:
+                if plan.is_complete:
+                    logger.info(f"本月從 {plan.start_date} 開始已完成 {plan.done_hours} 小時，達到或超過 {MONTHLY_REQUIRED_HOURS} 小時")
+                next_period = datetime.combine(plan.end_date + timedelta(days=1), datetime.min.time())
+                sleep_until(clock, next_period, "本月已無排程，等待下個月")
             continue
         
-        # 設定簽到時間
-        check_in_time = now.replace(hour=check_in_hour, minute=0, second=0, microsecond=0)
-        check_out_time = check_in_time + timedelta(hours=daily_work_hours)
-        
         # 如果當前時間早於簽到時間，等待到簽到時間
-        if now < check_in_time:
-            wait_seconds = (check_in_time - now).total_seconds()
-            logger.info(f"等待到 {check_in_hour}:00 簽到，還有 {int(wait_seconds/60)} 分鐘")
-            time.sleep(wait_seconds)
+        check_in_time = max(now, slot.sign_in)
+        
+        # 今天剩下的時間不夠完成排程的時數，不要跨日簽退，改從明天開始排
+        end_of_day = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        if check_in_time + timedelta(hours=slot.hours) > end_of_day:
+            logger.info(f"今天剩下的時間不足 {slot.hours} 小時，改從明天開始排程")
+            plan.replan(plan.done_hours, today + timedelta(days=1))
+            sign_in_failures = 0
+            continue
+        sleep_until(clock, check_in_time, f"等待到 {check_in_time.strftime('%H:%M')} 簽到")
         
         # 執行簽到
         try:
-            handle_singin_singout()  # 簽到
-            sign_in_time = datetime.now()
-            record_attendance("SignIn", sign_in_time)
+            done = sign_action("SignIn", today)  # 簽到
+            sign_in_time = clock.now()
+            if done is not False:
+                record_attendance("SignIn", sign_in_time, record_dir)
+            else:
+                # 簽到由其他 worker 完成，簽退時間和時數要從它記錄的簽到時間起算，才會和紀錄檔一致
+                recorded = get_last_sign_in(today, record_dir)
+                if recorded is not None:
+                    sign_in_time = recorded
+                else:
+                    logger.warning("找不到其他 worker 記錄的簽到時間，改從現在開始計算")
+        except CredentialsError:
+            # 沒有設定帳號密碼，重試也不會成功
+            raise
         except Exception as e:
-            logger.error(f"簽到失敗: {e}")
-            time.sleep(60)
+            sign_in_failures += 1
+            logger.error(f"簽到失敗 ({sign_in_failures}/{MAX_SIGN_IN_ATTEMPTS}): {e}")
+            if sign_in_failures >= MAX_SIGN_IN_ATTEMPTS:
+                logger.error("今天的簽到失敗太多次，改從明天開始排程")
+                plan.replan(plan.done_hours, today + timedelta(days=1))
+                sign_in_failures = 0
+            else:
+                clock.sleep(get_retry_delay(sign_in_failures))
             continue
+        sign_in_failures = 0
+        
+        # 從實際記錄的簽到時間起算，避免簽到本身的耗時讓時數被無條件捨去少一小時
+        check_out_time = sign_in_time + timedelta(hours=slot.hours)
         
-        # 等待到簽退時間
+        # 等待到簽退時間，已經簽到了所以簽退失敗時不放棄，只拉長重試間隔
+        sign_out_failures = 0
         while True:
-            now = datetime.now()
-            time_left = (check_out_time - now).total_seconds()
+            now = clock.now()
             
             if now >= check_out_time:
                 try:
-                    handle_singin_singout()  # 簽退
-                    sign_out_time = datetime.now()
-                    record_attendance("SignOut", sign_out_time)
-                    logger.info(f"簽退完成，今天工作 {int((sign_out_time - sign_in_time).total_seconds() / 3600)} 小時")
-                    time.sleep(24 * 60 * 60)
+                    if sign_action("SignOut", today) is False:
+                        worked_hours = None
+                        break
+                    sign_out_time = clock.now()
+                    record_attendance("SignOut", sign_out_time, record_dir)
+                    worked_hours = int((sign_out_time - sign_in_time).total_seconds() / 3600)
+                    logger.info(f"簽退完成，今天工作 {worked_hours} 小時")
                     break
                 except Exception as e:
-                    logger.error(f"簽退失敗: {e}")
-                    time.sleep(60)
+                    sign_out_failures += 1
+                    logger.error(f"簽退失敗 ({sign_out_failures} 次): {e}")
+                    clock.sleep(get_retry_delay(sign_out_failures))
             else:
-                hours_left = time_left / 3600
-                logger.info(f"距離簽退還有 {hours_left:.2f} 小時")
-                time.sleep(60)
+                sleep_until(clock, check_out_time, "距離簽退")
+        
+        # 從明天開始依實際完成的時數更新排程
+        if worked_hours is None:
+            # 簽退不是由自己完成（其他 worker 完成，或中斷後狀態不明），時數以紀錄檔為準。
+            # 不能重建今天的排程，紀錄檔裡沒有簽退時會一直重新認領同一個事件
+            plan.replan(get_total_hours(plan.start_date, today=today, record_dir=record_dir),
+                        today + timedelta(days=1))
+        else:
+            plan.replan(plan.done_hours + worked_hours, today + timedelta(days=1))
 
 if __name__ == "__main__":
+    # 清掉上次執行（例如容器重啟前）留下的 Chrome 行程和 profile
+    browser_governor.reap_orphans()
+    browser_governor.start_reaper(int(os.getenv("BROWSER_REAP_INTERVAL", 600)))
     auto_check_in_out(check_in_hour=9, daily_work_hours=4)
\ No newline at end of file
@@ -11,6 +11,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
+from browser_governor import BrowserGovernor
+from slow_trace import SlowTracer
 from exceptions import (
     LoginException, CredentialsError, LoginFailedError,
     HRSystemError, TimeClockSystemError,
@@ -21,25 +23,42 @@ from exceptions import (
 # 設定 logger
 logger = logging.getLogger(__name__)
 
-def login_to_nycu_portal():
+# 管理 Chrome 行程與暫存 profile
+browser_governor = BrowserGovernor.from_env()
+
+# 簽到/簽退太慢時記錄 Chrome 效能追蹤和截圖，設定 SLOW_TRACE_THRESHOLD 才會啟用
+slow_tracer = SlowTracer.from_env()
+
+# 按鈕上顯示的文字，代表按下去會執行的操作
+ACTION_BUTTON_TEXT = {"SignIn": "簽到", "SignOut": "簽退"}
+
+def login_to_nycu_portal(username=None, password=None):
     # 載入環境變數
     load_dotenv()
     
-    # 從環境變數獲取帳號密碼
-    username = os.getenv("NYCU_USERNAME")
-    password = os.getenv("NYCU_PASSWORD")
+    # 沒有指定帳號密碼時，從環境變數獲取
+    username = username or os.getenv("NYCU_USERNAME")
+    password = password or os.getenv("NYCU_PASSWORD")
     
     if not username or not password:
         raise CredentialsError("請在 .env 檔案中設定 NYCU_USERNAME 和 NYCU_PASSWORD")
     
-    service = Service(executable_path=ChromeDriverManager().install())
+    profile_dir = browser_governor.new_profile_dir()
+    service = Service(
+        executable_path=ChromeDriverManager().install(),
+        env=browser_governor.browser_env(profile_dir)
+    )
     
     # 設定 Chrome 選項
     chrome_options = Options()
     chrome_options.add_argument("--headless")
+    chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    slow_tracer.configure(chrome_options)
     
     # 初始化 WebDriver
     driver = webdriver.Chrome(service=service, options=chrome_options)
+    browser_governor.track(driver, profile_dir)
+    slow_tracer.attach(driver)
     
     try:
         # 直接訪問登入頁面
@@ -252,7 +271,14 @@ def navigate_to_work_hours_system(driver: webdriver.Chrome) -> webdriver.Chrome:
         logger.error(f"導航過程中發生錯誤: {e}")
         raise NavigationException(f"導航過程中發生錯誤: {e}")
         
-def toggle_signin_signout(driver: webdriver.Chrome):
+def toggle_signin_signout(driver: webdriver.Chrome, action=None, on_confirm=None):
+    """
+    點擊簽到/簽退按鈕
+
+    指定 action 時會先確認按鈕文字，網站已經是要切換的狀態（例如上次點擊後才發生錯誤）就不再點擊，
+    避免重試時把狀態切換回去。on_confirm 會在點擊「確定」之前呼叫，
+    讓呼叫端知道之後發生的錯誤可能已經切換了網站上的狀態
+    """
     iframes = driver.find_elements(By.TAG_NAME, "iframe")
     if iframes:
         driver.switch_to.frame(iframes[0])
@@ -263,6 +289,18 @@ def toggle_signin_signout(driver: webdriver.Chrome):
     
     button_text = button.text
     logger.debug(f"找到按鈕，文字為: {button_text}")
+    
+    if action is not None:
+        expected = ACTION_BUTTON_TEXT[action]
+        other = ACTION_BUTTON_TEXT["SignOut" if action == "SignIn" else "SignIn"]
+        if expected not in button_text:
+            if other in button_text:
+                logger.warning(f"按鈕顯示「{button_text}」，網站上已經{expected}過，不再點擊")
+                driver.switch_to.default_content()
+                return driver
+            error = SignInError if action == "SignIn" else SignOutError
+            raise error(f"按鈕文字「{button_text}」不是{expected}")
+    
     button.click()
     logger.debug("已點擊按鈕")
     
@@ -270,53 +308,71 @@ def toggle_signin_signout(driver: webdriver.Chrome):
     confirm_button = WebDriverWait(driver, 10).until(
         EC.element_to_be_clickable((By.XPATH, "//input[@id='ContentPlaceHolder1_Button_attend' and @value='確定']"))
     )
+    if on_confirm is not None:
+        on_confirm()
     confirm_button.click()
     logger.info("簽到/簽退操作完成！")
     
     driver.switch_to.default_content()
     return driver
 
-def handle_singin_singout():
-    try:
-        # 第一次操作：簽到
-        driver = login_to_nycu_portal()
-        driver = open_time_clock_system(driver)
-        driver = navigate_to_work_hours_system(driver)
-        driver = toggle_signin_signout(driver)
+def handle_singin_singout(username=None, password=None, action=None, on_confirm=None):
+    # 超過執行時間或記憶體限制時，governor 會先收集追蹤紀錄再砍掉整棵瀏覽器行程樹
+    with slow_tracer.action("簽到/簽退") as trace, \
+            browser_governor.action("簽到/簽退", before_kill=trace.on_violation):
+        try:
+            # 第一次操作：簽到
+            with trace.span("login_to_nycu_portal"):
+                driver = login_to_nycu_portal(username, password)
+            with trace.span("open_time_clock_system"):
+                driver = open_time_clock_system(driver)
+            with trace.span("navigate_to_work_hours_system"):
+                driver = navigate_to_work_hours_system(driver)
+            with trace.span("toggle_signin_signout"):
+                driver = toggle_signin_signout(driver, action, on_confirm)
 
-    except CredentialsError as e:
-        logger.error(f"憑證錯誤: {e}")
-        exit(1)
-    except LoginFailedError as e:
-        logger.error(f"登入失敗: {e}")
-        exit(1)
-    except LoginException as e:
-        logger.error(f"登入過程錯誤: {e}")
-        exit(1)
-    except TimeClockSystemError as e:
-        logger.error(f"人事差勤系統錯誤: {e}")
-        exit(1)
-    except ElementNotFoundError as e:
-        logger.error(f"找不到元素: {e}")
-        exit(1)
-    except NavigationException as e:
-        logger.error(f"導航錯誤: {e}")
-        exit(1)
-    except SignInError as e:
-        logger.error(f"簽到錯誤: {e}")
-        exit(1)
-    except SignOutError as e:
-        logger.error(f"簽退錯誤: {e}")
-        exit(1)
-    except ConfirmationError as e:
-        logger.error(f"確認操作錯誤: {e}")
-        exit(1)
-    except Exception as e:
-        logger.error(f"未預期的錯誤: {e}")
-        exit(1)
-    finally:
-        if 'driver' in locals():
-            driver.quit()
+        except CredentialsError as e:
+            logger.error(f"憑證錯誤: {e}")
+            raise
+        except LoginFailedError as e:
+            logger.error(f"登入失敗: {e}")
+            raise
+        except LoginException as e:
+            logger.error(f"登入過程錯誤: {e}")
+            raise
+        except TimeClockSystemError as e:
+            logger.error(f"人事差勤系統錯誤: {e}")
+            raise
+        except ElementNotFoundError as e:
+            logger.error(f"找不到元素: {e}")
+            raise
+        except NavigationException as e:
+            logger.error(f"導航錯誤: {e}")
+            raise
+        except SignInError as e:
+            logger.error(f"簽到錯誤: {e}")
+            raise
+        except SignOutError as e:
+            logger.error(f"簽退錯誤: {e}")
+            raise
+        except ConfirmationError as e:
+            logger.error(f"確認操作錯誤: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"未預期的錯誤: {e}")
+            raise
+        finally:
+            # 登入失敗時拿不到 driver，改用啟動瀏覽器時登記的
+            trace.collect()
+            if 'driver' in locals():
+                try:
+                    driver.quit()
+                except Exception as e:
+                    # 瀏覽器可能已經被 governor 砍掉
+                    logger.debug(f"關閉瀏覽器時發生錯誤: {e}")
+
+    stats = browser_governor.stats()
+    logger.debug(f"目前有 {stats['browsers']} 個瀏覽器，使用 {stats['rss_mb']:.0f} MB 記憶體")
             
 if __name__ == "__main__":
     # 設定 logging 基本配置
@@ -325,6 +381,6 @@ if __name__ == "__main__":
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    handle_singin_singout()
+    handle_singin_singout(action="SignIn")
     time.sleep(14460)
-    handle_singin_singout()
+    handle_singin_singout(action="SignOut")
@@ -0,0 +1,194 @@
+import logging
+
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+
+from calendar_holiday import get_nycu_calendar_holidays, check_weekend
+
+# 設定 logger
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SignSlot:
+    """單日的簽到/簽退排程"""
+    day: date
+    sign_in: datetime
+    sign_out: datetime
+    hours: int
+
+
+def get_next_period_start(start_date: date, start_day: int) -> date:
+    """根據每月開始日計算下一個計算週期的開始日期"""
+    year, month = (start_date.year, start_date.month + 1) if start_date.month < 12 else (start_date.year + 1, 1)
+    try:
+        return date(year, month, start_day)
+    except ValueError:
+        # 如果日期無效（例如2月30號），調整到該月最後一天
+        next_month = date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)
+        return next_month - timedelta(days=1)
+
+
+def get_period_holidays(start_date: date, end_date: date) -> Optional[set]:
+    """獲取計算週期內（可能跨月）的所有假期，任何一個月份無法取得行事曆時回傳 None"""
+    holidays = set()
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        date_strs = get_nycu_calendar_holidays(year, month)
+        if date_strs is None:
+            return None
+        for date_str in date_strs:
+            holidays.add(datetime.strptime(date_str, "%Y-%m-%d").date())
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    return holidays
+
+
+class MonthlyPlan:
+    """
+    一個計算週期的工作日點陣圖與簽到排程
+
+    點陣圖的第 i 個位元代表 start_date + i 天是否為工作日，
+    剩餘工作日與下一個工作日的查詢都只需要位元運算。
+    provisional 代表建立時無法取得行事曆，假期只排除了周末，之後需要重新建立。
+    """
+
+    def __init__(self, start_date: date, end_date: date, holidays, required_hours: int,
+                 daily_work_hours: int = 8, check_in_hour: int = 9, provisional: bool = False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.required_hours = required_hours
+        self.daily_work_hours = daily_work_hours
+        self.check_in_hour = check_in_hour
+        self.holidays = frozenset(holidays)
+        self.provisional = provisional
+
+        self.bitmap = 0
+        for offset in range(self.num_days):
+            day = start_date + timedelta(days=offset)
+            if not check_weekend(day) and day not in self.holidays:
+                self.bitmap |= 1 << offset
+
+        self.done_hours = 0
+        self.schedule: List[SignSlot] = []
+        self._slots: Dict[date, SignSlot] = {}
+
+    @property
+    def num_days(self) -> int:
+        return (self.end_date - self.start_date).days + 1
+
+    def contains(self, day: date) -> bool:
+        """檢查日期是否在本計算週期內"""
+        return self.start_date <= day <= self.end_date
+
+    def _offset(self, day: date) -> int:
+        return (day - self.start_date).days
+
+    def is_workday(self, day: date) -> bool:
+        """檢查是否為工作日（排除周末和假期）"""
+        if not self.contains(day):
+            return False
+        return bool(self.bitmap >> self._offset(day) & 1)
+
+    def remaining_workdays(self, day: date) -> int:
+        """計算從指定日期（含）到週期結束的剩餘工作日數"""
+        if day > self.end_date:
+            return 0
+        offset = max(self._offset(day), 0)
+        return (self.bitmap >> offset).bit_count()
+
+    def next_workday(self, day: date) -> Optional[date]:
+        """找出指定日期之後（不含）的下一個工作日，週期內沒有則回傳 None"""
+        offset = self._offset(day) + 1
+        if offset >= self.num_days:
+            return None
+        mask = self.bitmap >> max(offset, 0)
+        if not mask:
+            return None
+        return self.start_date + timedelta(days=max(offset, 0) + (mask & -mask).bit_length() - 1)
+
+    def replan(self, done_hours: int, from_day: date, today_hours: int = 0) -> List[SignSlot]:
+        """
+        根據已完成的時數，從指定日期開始重新排出達到每月時數所需的簽到排程
+
+        Args:
+            done_hours: 本週期已完成的總時數（包含 today_hours）
+            from_day: 開始排程的日期
+            today_hours: from_day 當天已經記錄的時數
+
+        Returns:
+            list: 依日期排序的 SignSlot
+        """
+        self.done_hours = done_hours
+        self.schedule = []
+        remaining = self.required_hours - done_hours
+
+        day = from_day if self.is_workday(from_day) else self.next_workday(from_day)
+        while day is not None and remaining > 0:
+            hours = self.daily_work_hours - (today_hours if day == from_day else 0)
+            hours = min(hours, remaining)
+            if hours > 0:
+                sign_in = datetime.combine(day, datetime.min.time()).replace(hour=self.check_in_hour)
+                self.schedule.append(SignSlot(day, sign_in, sign_in + timedelta(hours=hours), hours))
+                remaining -= hours
+            day = self.next_workday(day)
+
+        if remaining > 0:
+            logger.warning(f"本週期剩餘工作日不足，排程後仍差 {remaining} 小時")
+
+        self._slots = {slot.day: slot for slot in self.schedule}
+        return self.schedule
+
+    def slot_for(self, day: date) -> Optional[SignSlot]:
+        """取得指定日期的排程，沒有排程則回傳 None"""
+        return self._slots.get(day)
+
+    def next_slot(self, day: date) -> Optional[SignSlot]:
+        """取得指定日期之後（不含）的第一個排程"""
+        for slot in self.schedule:
+            if slot.day > day:
+                return slot
+        return None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.done_hours >= self.required_hours
+
+
+def build_monthly_plan(start_date: date, start_day: int, required_hours: int,
+                       daily_work_hours: int = 8, check_in_hour: int = 9,
+                       done_hours: int = 0, from_day: Optional[date] = None,
+                       today_hours: int = 0, holiday_source=None) -> MonthlyPlan:
+    """
+    建立一個計算週期的工作日點陣圖，並預先排出達到每月時數的簽到排程
+
+    Args:
+        start_date: 本週期開始日期
+        start_day: 每月幾號開始計算 (MONTHLY_START_DAY)
+        required_hours: 每月需要的時數
+        daily_work_hours: 每天工作時數
+        check_in_hour: 每天簽到的時間
+        done_hours: 本週期已完成的總時數
+        from_day: 開始排程的日期，默認為 start_date
+        today_hours: from_day 當天已經記錄的時數
+        holiday_source: 給定 (start_date, end_date) 回傳假期集合的函數，默認為 get_period_holidays，
+            無法取得假期時回傳 None
+
+    Returns:
+        MonthlyPlan: 本週期的排程，無法取得假期時為暫時的排程（provisional）
+    """
+    end_date = get_next_period_start(start_date, start_day) - timedelta(days=1)
+    holidays = (holiday_source or get_period_holidays)(start_date, end_date)
+    provisional = holidays is None
+    if provisional:
+        logger.warning(f"無法取得 {start_date} ~ {end_date} 的假期，暫時只排除周末，之後會重新取得")
+        holidays = set()
+    plan = MonthlyPlan(start_date, end_date, holidays, required_hours, daily_work_hours, check_in_hour,
+                       provisional=provisional)
+    plan.replan(done_hours, from_day or start_date, today_hours)
+
+    logger.info(
+        f"本週期 {start_date} ~ {end_date} 共 {plan.remaining_workdays(start_date)} 個工作日，"
+        f"已完成 {done_hours} 小時，排程 {len(plan.schedule)} 天"
+    )
+    return plan
@@ -0,0 +1,373 @@
+import os
+import json
+import signal
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+from clock import StoppableClock, ClockStopped
+from exceptions import CredentialsError, LeaseLostError
+from main import RECORD_DIR, auto_check_in_out
+from nycu_sign import handle_singin_singout, browser_governor
+
+# 設定 logger
+logger = logging.getLogger(__name__)
+
+# 超過這個天數的簽到/簽退事件紀錄會被清掉
+EVENT_RETENTION_DAYS = 40
+
+
+def load_accounts(path):
+    """
+    讀取帳號設定檔
+
+    設定檔為 JSON 陣列，每個帳號需要 username 和 password，
+    可以另外設定 check_in_hour 和 daily_work_hours
+
+    Returns:
+        list: 帳號設定
+    """
+    with open(path, "r") as f:
+        accounts = json.load(f)
+    return [
+        {
+            "username": account["username"],
+            "password": account["password"],
+            "check_in_hour": account.get("check_in_hour", 9),
+            "daily_work_hours": account.get("daily_work_hours", 4),
+        }
+        for account in accounts
+    ]
+
+
+def owner_of(account, nodes):
+    """
+    用 rendezvous hashing 決定帳號該由哪個節點負責
+
+    節點加入或離開時，只有原本屬於那個節點的帳號會換手
+    """
+    if not nodes:
+        return None
+    return max(nodes, key=lambda node: hashlib.sha256(f"{node}:{account}".encode()).digest())
+
+
+class LeaseStore:
+    """
+    用 SQLite 檔案讓多個 worker 分配帳號
+
+    - nodes: 每個 worker 的心跳時間
+    - leases: 帳號目前由哪個 worker 負責，以及租約到期時間
+    - events: 每個排程的簽到/簽退事件，確保只會執行一次
+
+    使用 SQLite 預設的 rollback journal 加上 BEGIN IMMEDIATE 取得寫入鎖，
+    WAL 需要共用記憶體，不能用在多台機器共用的檔案上。SQLite 的檔案鎖在網路檔案系統（例如 NFS、SMB）上
+    不一定可靠，只支援所有 worker 在同一台機器上（例如同一台主機上的多個容器）共用這個檔案。
+
+    Args:
+        path: SQLite 檔案路徑，所有 worker 必須能存取同一個檔案
+        ttl: 心跳和租約的有效秒數
+    """
+
+    def __init__(self, path, ttl=600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                account TEXT PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                account TEXT NOT NULL,
+                event_key TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (account, event_key)
+            );
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        """以 BEGIN IMMEDIATE 取得寫入鎖，避免多個 worker 同時修改"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def heartbeat(self, node_id):
+        """更新節點心跳，並續約節點持有的所有租約"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO nodes (node_id, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (node_id, now)
+            )
+            conn.execute("UPDATE leases SET expires = ? WHERE node_id = ?", (now + self.ttl, node_id))
+            conn.execute("DELETE FROM nodes WHERE heartbeat < ?", (now - self.ttl,))
+            conn.execute("DELETE FROM events WHERE updated < ?", (now - EVENT_RETENTION_DAYS * 86400,))
+
+    def live_nodes(self):
+        """取得心跳還沒過期的節點"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT node_id FROM nodes WHERE heartbeat >= ? ORDER BY node_id",
+                (time.time() - self.ttl,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def owned_accounts(self, node_id):
+        """取得節點目前持有有效租約的帳號"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT account FROM leases WHERE node_id = ? AND expires >= ?",
+                (node_id, time.time())
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def acquire(self, node_id, account):
+        """
+        嘗試取得帳號的租約
+
+        Returns:
+            bool: 帳號沒有人持有、租約已過期或本來就是自己的才會成功
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT node_id, expires FROM leases WHERE account = ?", (account,)).fetchone()
+            if row is not None and row[0] != node_id and row[1] >= now:
+                return False
+            conn.execute(
+                "INSERT INTO leases (account, node_id, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(account) DO UPDATE SET node_id = excluded.node_id, expires = excluded.expires",
+                (account, node_id, now + self.ttl)
+            )
+        return True
+
+    def release(self, node_id, account):
+        """釋放自己持有的帳號租約"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE account = ? AND node_id = ?", (account, node_id))
+
+    def leave(self, node_id):
+        """節點離開，釋放所有租約"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE node_id = ?", (node_id,))
+            conn.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def claim_event(self, node_id, account, event_key):
+        """
+        認領一個簽到/簽退事件，每個事件只會被認領成功一次
+
+        如果事件停在執行中，代表上一個負責的節點在操作途中掛掉，
+        無法確定網站上是否已經簽到/簽退，為了避免重複切換狀態，不會再執行。
+
+        Returns:
+            bool: 是否認領成功，成功才可以執行操作
+
+        Raises:
+            LeaseLostError: 帳號的租約已經不屬於這個節點
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            lease = conn.execute("SELECT node_id, expires FROM leases WHERE account = ?", (account,)).fetchone()
+            if lease is None or lease[0] != node_id or lease[1] < now:
+                raise LeaseLostError(f"{account} 的租約已經不屬於 {node_id}")
+
+            row = conn.execute(
+                "SELECT node_id, status FROM events WHERE account = ? AND event_key = ?",
+                (account, event_key)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO events (account, event_key, node_id, status, updated) VALUES (?, ?, ?, 'running', ?)",
+                    (account, event_key, node_id, now)
+                )
+                return True
+
+            if row[1] == "running":
+                logger.error(f"{account} 的 {event_key} 在 {row[0]} 執行途中中斷，無法確定是否完成，不再重複執行")
+                conn.execute(
+                    "UPDATE events SET status = 'unknown', updated = ? WHERE account = ? AND event_key = ?",
+                    (now, account, event_key)
+                )
+            return False
+
+    def finish_event(self, node_id, account, event_key, success, confirmed=False):
+        """
+        完成事件，失敗時刪除事件讓它可以重試
+
+        失敗前已經點擊過確定按鈕（confirmed）時，網站上可能已經切換了狀態，
+        標記為 unknown 不再重試，避免重複切換
+        """
+        with self._transaction() as conn:
+            if success or confirmed:
+                conn.execute(
+                    "UPDATE events SET status = ?, updated = ? WHERE account = ? AND event_key = ? AND node_id = ?",
+                    ("done" if success else "unknown", time.time(), account, event_key, node_id)
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM events WHERE account = ? AND event_key = ? AND node_id = ?",
+                    (account, event_key, node_id)
+                )
+
+
+class ShardWorker:
+    """
+    一個 worker 節點，透過租約負責一部分帳號的自動簽到
+
+    每個負責的帳號都有自己的排程執行緒，節點加入或離開時，
+    不再屬於自己的帳號會等目前的操作結束後才釋放租約。
+
+    Args:
+        store: 共用的 LeaseStore
+        node_id: 節點名稱，所有節點之間必須唯一
+        accounts: 帳號設定
+        max_browsers: 這個節點同時最多開幾個瀏覽器
+    """
+
+    def __init__(self, store, node_id, accounts, max_browsers=2):
+        self.store = store
+        self.node_id = node_id
+        self.accounts = {account["username"]: account for account in accounts}
+        self._browser_slots = threading.Semaphore(max_browsers)
+        # 帳號密碼設定錯誤的帳號，不再分配
+        self._invalid = set()
+        # 帳號 -> (排程執行緒, 時鐘)
+        self._running = {}
+        self._stopped = threading.Event()
+
+    def _run_account(self, account, clock):
+        username = account["username"]
+        record_dir = RECORD_DIR / username
+        record_dir.mkdir(parents=True, exist_ok=True)
+
+        def sign_action(action, day):
+            event_key = f"{day}:{action}"
+            if not self.store.claim_event(self.node_id, username, event_key):
+                logger.info(f"{username} {event_key} 已經由其他 worker 處理，略過")
+                return False
+            confirmed = threading.Event()
+            try:
+                with self._browser_slots:
+                    handle_singin_singout(username, account["password"], action, on_confirm=confirmed.set)
+            except BaseException:
+                if confirmed.is_set():
+                    logger.error(f"{username} {event_key} 點擊確定後發生錯誤，無法確定是否完成，不再重複執行")
+                self.store.finish_event(
+                    self.node_id, username, event_key, success=False, confirmed=confirmed.is_set()
+                )
+                raise
+            self.store.finish_event(self.node_id, username, event_key, success=True)
+            return True
+
+        try:
+            auto_check_in_out(
+                check_in_hour=account["check_in_hour"],
+                daily_work_hours=account["daily_work_hours"],
+                clock=clock,
+                sign_action=sign_action,
+                record_dir=record_dir,
+            )
+        except ClockStopped:
+            logger.info(f"{username} 的排程已停止")
+        except CredentialsError as e:
+            # 執行緒結束後 rebalance 會釋放租約，之後也不會再分配給這個節點
+            logger.error(f"{username} 的帳號密碼設定錯誤，不再負責這個帳號: {e}")
+            self._invalid.add(username)
+
+    def rebalance(self):
+        """續約並依照目前存活的節點重新分配帳號"""
+        self.store.heartbeat(self.node_id)
+        nodes = self.store.live_nodes()
+        owned = self.store.owned_accounts(self.node_id)
+        targets = {
+            account for account in self.accounts
+            if account not in self._invalid and owner_of(account, nodes) == self.node_id
+        }
+
+        for account, (thread, clock) in list(self._running.items()):
+            if not thread.is_alive():
+                # 執行緒已經結束，等操作完成後才釋放租約，避免重複簽到
+                self.store.release(self.node_id, account)
+                del self._running[account]
+            elif account not in targets or account not in owned:
+                clock.stop()
+
+        for account in targets - set(self._running):
+            if not self.store.acquire(self.node_id, account):
+                continue
+            clock = StoppableClock()
+            thread = threading.Thread(
+                target=self._run_account, args=(self.accounts[account], clock),
+                name=f"account-{account}", daemon=True
+            )
+            self._running[account] = (thread, clock)
+            thread.start()
+            logger.info(f"{self.node_id} 開始負責 {account}")
+
+    def run(self):
+        """持續續約與重新分配帳號，直到 stop 被呼叫"""
+        interval = self.store.ttl / 3
+        logger.info(f"{self.node_id} 加入，共有 {len(self.accounts)} 個帳號")
+        try:
+            while not self._stopped.is_set():
+                try:
+                    self.rebalance()
+                except sqlite3.Error as e:
+                    logger.error(f"重新分配帳號時發生錯誤: {e}")
+                self._stopped.wait(interval)
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+    def shutdown(self):
+        """停止所有排程，等正在進行的操作結束後釋放租約並離開"""
+        for thread, clock in self._running.values():
+            clock.stop()
+        for thread, _ in self._running.values():
+            thread.join()
+        self._running.clear()
+        self.store.leave(self.node_id)
+        logger.info(f"{self.node_id} 已離開")
+
+
+if __name__ == "__main__":
+    accounts = load_accounts(os.getenv("ACCOUNTS_FILE", "accounts.json"))
+    RECORD_DIR.mkdir(parents=True, exist_ok=True)
+    store = LeaseStore(
+        os.getenv("SHARD_STORE", str(RECORD_DIR / "shard.sqlite3")),
+        ttl=int(os.getenv("LEASE_TTL", 600)),
+    )
+    worker = ShardWorker(
+        store,
+        os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}",
+        accounts,
+        max_browsers=int(os.getenv("MAX_BROWSERS", 2)),
+    )
+
+    # 容器停止時先交出帳號再離開
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+
+    browser_governor.reap_orphans()
+    browser_governor.start_reaper(int(os.getenv("BROWSER_REAP_INTERVAL", 600)))
+    worker.run()
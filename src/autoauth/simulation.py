@@ -0,0 +1,229 @@
+import argparse
+import calendar
+import logging
+import random
+import resource
+import tempfile
+import time
+
+from datetime import datetime, date, timedelta
+from pathlib import Path
+
+from calendar_holiday import check_weekend
+from clock import VirtualTimeline, SimulationFinished
+from exceptions import AttendanceException
+from main import MONTHLY_REQUIRED_HOURS, MONTHLY_START_DAY, auto_check_in_out
+
+# 設定 logger
+logger = logging.getLogger(__name__)
+
+
+def generate_holidays(year, seed=0, count=12):
+    """產生模擬用的假期：隨機的單日假期加上一段跨周末的連假"""
+    rng = random.Random(seed)
+    holidays = {date(year, 1, 1)}
+
+    # 模擬農曆年連假
+    lunar_new_year = date(year, 1, 27) + timedelta(days=rng.randint(0, 20))
+    for i in range(6):
+        holidays.add(lunar_new_year + timedelta(days=i))
+
+    while len(holidays) < count + 6:
+        holidays.add(date(year, 1, 1) + timedelta(days=rng.randint(0, 364)))
+    return holidays
+
+
+def get_period_starts(first, last, start_day):
+    """
+    列出 first 到 last 之間（含）每個計算週期的開始日期
+
+    刻意不使用 main/planner 的週期計算，直接用 calendar.monthrange 把開始日調整到月底，
+    週期邊界有錯時驗證才抓得到
+    """
+    starts = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        day = min(start_day, calendar.monthrange(year, month)[1])
+        if first <= date(year, month, day) <= last:
+            starts.append(date(year, month, day))
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    return starts
+
+
+def read_records(record_dir):
+    """讀取帳號所有月份的簽到/簽退紀錄"""
+    records = []
+    for month_file in sorted(record_dir.glob("*.txt")):
+        with open(month_file, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                records.append((datetime.strptime(f"{parts[0]} {parts[1]}", "%Y-%m-%d %H:%M:%S"), parts[2]))
+    records.sort()
+    return records
+
+
+def verify_account(record_dir, holidays, start, end, check_in_hour, daily_work_hours):
+    """
+    檢查帳號的簽到紀錄是否符合排程規則
+
+    Returns:
+        list: 錯誤訊息，空的代表全部正確
+    """
+    errors = []
+    records = read_records(record_dir)
+
+    # 簽到/簽退必須成對，且只能發生在工作日的簽到時間之後
+    pairs = []
+    for i in range(0, len(records), 2):
+        sign_in, sign_out = records[i], records[i + 1] if i + 1 < len(records) else None
+        if sign_in[1] != "SignIn" or sign_out is None or sign_out[1] != "SignOut":
+            errors.append(f"紀錄未成對: {sign_in}")
+            break
+        day = sign_in[0].date()
+        if check_weekend(day) or day in holidays:
+            errors.append(f"{day} 不是工作日卻簽到")
+        if sign_in[0].hour < check_in_hour:
+            errors.append(f"{sign_in[0]} 早於 {check_in_hour}:00 簽到")
+        if sign_out[0].date() != day:
+            errors.append(f"{sign_in[0]} 的簽退跨日")
+        pairs.append((sign_in[0], int((sign_out[0] - sign_in[0]).total_seconds() / 3600)))
+
+    # 每個完整的計算週期都必須剛好達到每月時數（工作日不足時則是排滿）
+    period_starts = get_period_starts(start.date(), end.date(), MONTHLY_START_DAY)
+    for period_start, period_end in zip(period_starts, period_starts[1:]):
+        workdays = sum(
+            1 for i in range((period_end - period_start).days)
+            if not check_weekend(period_start + timedelta(days=i))
+            and period_start + timedelta(days=i) not in holidays
+        )
+        expected = min(MONTHLY_REQUIRED_HOURS, workdays * daily_work_hours)
+        hours = sum(h for t, h in pairs if period_start <= t.date() < period_end)
+        if hours != expected:
+            errors.append(f"{period_start} ~ {period_end} 完成 {hours} 小時，應為 {expected} 小時")
+
+    return errors
+
+
+def simulate_account(clock, record_dir, holidays, check_in_hour, daily_work_hours,
+                     failure_rate=0.0, rng=None):
+    """
+    用虛擬時鐘跑一個帳號的排程，直到時鐘拋出 SimulationFinished
+
+    Returns:
+        int: 執行簽到/簽退的次數（包含失敗的）
+    """
+    rng = rng or random.Random()
+    sign_count = 0
+
+    def sign_action(action, day):
+        nonlocal sign_count
+        sign_count += 1
+        # 模擬登入和點擊的耗時
+        clock.sleep(rng.uniform(10, 40))
+        if rng.random() < failure_rate:
+            raise AttendanceException("模擬簽到/簽退失敗")
+
+    def holiday_source(start_date, end_date):
+        return {day for day in holidays if start_date <= day <= end_date}
+
+    try:
+        auto_check_in_out(
+            check_in_hour=check_in_hour,
+            daily_work_hours=daily_work_hours,
+            clock=clock,
+            sign_action=sign_action,
+            record_dir=record_dir,
+            holiday_source=holiday_source,
+        )
+    except SimulationFinished:
+        pass
+    return sign_count
+
+
+def run_simulation(accounts=10000, year=None, failure_rate=0.0, seed=0):
+    """
+    模擬多個帳號一整年的排程，並回報排程的 CPU 時間、記憶體與決策正確性
+
+    所有帳號在同一條虛擬時間軸上同時排程，每個帳號一個執行緒（和 sharding 相同），
+    所以記憶體用量包含所有帳號的排程狀態和執行緒，per_account_kb 為扣掉建立排程前用量後的平均。
+
+    Returns:
+        dict: 模擬結果
+    """
+    year = year or datetime.now().year
+    start = datetime(year, 1, 1)
+    end = datetime(year + 1, 1, 1)
+    holidays = generate_holidays(year, seed)
+    rng = random.Random(seed)
+
+    failed_accounts = {}
+    # Linux 上 ru_maxrss 的單位是 KB
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall_start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        timeline = VirtualTimeline(start, end)
+        settings = []
+        sign_counts = {}
+        for account in range(accounts):
+            record_dir = Path(tmp_dir) / str(account)
+            record_dir.mkdir()
+            check_in_hour = rng.choice([8, 9, 10])
+            daily_work_hours = rng.choice([4, 8])
+            settings.append((record_dir, check_in_hour, daily_work_hours))
+
+            def run(clock, account=account, record_dir=record_dir,
+                    check_in_hour=check_in_hour, daily_work_hours=daily_work_hours):
+                sign_counts[account] = simulate_account(
+                    clock, record_dir, holidays, check_in_hour, daily_work_hours,
+                    failure_rate=failure_rate, rng=rng
+                )
+
+            timeline.spawn(run, name=f"account-{account}")
+
+        cpu_start = time.process_time()
+        timeline.run()
+        scheduler_cpu = time.process_time() - cpu_start
+        wall_seconds = time.perf_counter() - wall_start
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        for account, (record_dir, check_in_hour, daily_work_hours) in enumerate(settings):
+            errors = verify_account(record_dir, holidays, start, end, check_in_hour, daily_work_hours)
+            if errors:
+                failed_accounts[account] = errors
+
+    return {
+        "accounts": accounts,
+        "year": year,
+        "sign_actions": sum(sign_counts.values()),
+        "scheduler_cpu_seconds": scheduler_cpu,
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": peak_rss_kb / 1024,
+        "per_account_kb": max(peak_rss_kb - baseline_rss_kb, 0) / max(accounts, 1),
+        "failed_accounts": failed_accounts,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用虛擬時鐘模擬多個帳號一整年的簽到排程")
+    parser.add_argument("--accounts", type=int, default=10000, help="模擬的帳號數量")
+    parser.add_argument("--year", type=int, default=None, help="模擬的年份，默認為今年")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="簽到/簽退失敗的機率")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--log-level", default="CRITICAL", help="排程本身的 log 等級")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    result = run_simulation(args.accounts, args.year, args.failure_rate, args.seed)
+
+    print(f"在同一條虛擬時間軸上模擬 {result['accounts']} 個帳號 {result['year']} 年整年的排程")
+    print(f"簽到/簽退次數: {result['sign_actions']}")
+    print(f"排程 CPU 時間: {result['scheduler_cpu_seconds']:.2f} 秒 "
+          f"(每個帳號 {result['scheduler_cpu_seconds'] / result['accounts'] * 1000:.2f} 毫秒)")
+    print(f"實際耗時: {result['wall_seconds']:.2f} 秒")
+    print(f"最高記憶體用量: {result['peak_rss_mb']:.1f} MB (每個帳號 {result['per_account_kb']:.1f} KB)")
+    print(f"決策正確: {result['accounts'] - len(result['failed_accounts'])}/{result['accounts']}")
+    for account, errors in list(result["failed_accounts"].items())[:10]:
+        print(f"帳號 {account}: {errors[0]}")
@@ -0,0 +1,231 @@
+import os
+import json
+import shutil
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# 設定 logger
+logger = logging.getLogger(__name__)
+
+# Chrome 效能追蹤要記錄的類別，可以直接用 DevTools 的 Performance 面板開啟
+TRACE_CATEGORIES = "devtools.timeline,blink.user_timing,loading,navigation"
+
+
+class Trace:
+    """
+    一次簽到/簽退操作的追蹤紀錄
+
+    Args:
+        name: 操作名稱
+        threshold: 超過幾秒才記錄，None 代表不記錄
+    """
+
+    def __init__(self, name, threshold):
+        self.name = name
+        self.threshold = threshold
+        self.start = time.monotonic()
+        self.started_at = datetime.now()
+        self.spans = []
+        self.network = []
+        self.trace_events = []
+        self.screenshot = None
+        self.page_source = None
+        # 操作中的瀏覽器，啟動後馬上登記，登入失敗時也能收集
+        self.driver = None
+        # 被 governor 強制結束的原因
+        self.violation = None
+        self._collected = False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @property
+    def is_slow(self):
+        return self.threshold is not None and self.elapsed >= self.threshold
+
+    @property
+    def should_save(self):
+        """超過門檻，或是啟用時被 governor 強制結束"""
+        return self.is_slow or (self.threshold is not None and self.violation is not None)
+
+    @contextmanager
+    def span(self, name):
+        """記錄一個步驟的開始與結束時間"""
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.spans.append({
+                "name": name,
+                "start": round(start - self.start, 3),
+                "duration": round(time.monotonic() - start, 3),
+                "error": error,
+            })
+
+    def collect(self, driver=None):
+        """
+        在關閉瀏覽器之前收集 Chrome 的效能紀錄、截圖和頁面原始碼
+
+        沒有指定 driver 時使用登記的瀏覽器。只有需要存下紀錄時才會收集，
+        每次操作只收集一次，瀏覽器已經被結束時會略過
+        """
+        driver = driver or self.driver
+        if driver is None or self._collected or not self.should_save:
+            return
+        self._collected = True
+        try:
+            for entry in driver.get_log("performance"):
+                message = json.loads(entry["message"])["message"]
+                if message["method"] == "Tracing.dataCollected":
+                    self.trace_events.extend(message["params"].get("value", []))
+                else:
+                    self.network.append(message)
+            self.screenshot = driver.get_screenshot_as_png()
+            self.page_source = driver.page_source
+        except Exception as e:
+            logger.debug(f"收集瀏覽器追蹤紀錄時發生錯誤: {e}")
+
+    def on_violation(self, reason):
+        """governor 砍掉瀏覽器之前呼叫，趁瀏覽器還活著時收集紀錄"""
+        self.violation = reason
+        self.collect()
+
+
+class SlowTracer:
+    """
+    簽到/簽退操作超過門檻時，把追蹤紀錄存到磁碟上固定大小的環狀緩衝區
+
+    每次紀錄存成一個目錄，包含：
+    - spans.json: 每個步驟的時間軸
+    - network.json: DevTools 的 Network/Page 事件
+    - trace.json: Chrome 效能追蹤，可以用 DevTools 的 Performance 面板開啟
+    - screenshot.png / page.html: 關閉瀏覽器前的畫面與原始碼
+
+    Args:
+        threshold: 超過幾秒才記錄，0 代表不啟用
+        trace_dir: 紀錄存放的目錄
+        max_mb: 所有紀錄最多佔用多少 MB，超過時從最舊的開始刪
+    """
+
+    def __init__(self, threshold=0, trace_dir="./slow_traces", max_mb=100):
+        self.threshold = threshold
+        self.trace_dir = Path(trace_dir)
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._count = 0
+        # 每個執行緒目前正在追蹤的操作
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """從環境變數建立 SlowTracer"""
+        return cls(
+            threshold=float(os.getenv("SLOW_TRACE_THRESHOLD", 0)),
+            trace_dir=os.getenv("SLOW_TRACE_DIR", "./slow_traces"),
+            max_mb=int(os.getenv("SLOW_TRACE_MAX_MB", 100)),
+        )
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def configure(self, chrome_options):
+        """讓 Chrome 記錄效能追蹤和網路事件"""
+        if not self.enabled:
+            return
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        chrome_options.add_experimental_option("perfLoggingPrefs", {
+            "enableNetwork": True,
+            "enablePage": True,
+            "traceCategories": TRACE_CATEGORIES,
+        })
+
+    def attach(self, driver):
+        """登記目前執行緒正在追蹤的操作所使用的瀏覽器"""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.driver = driver
+
+    @contextmanager
+    def action(self, name):
+        """
+        追蹤一次操作，結束時如果超過門檻或被 governor 強制結束就存下紀錄
+
+        Yields:
+            Trace: 用來記錄步驟和收集瀏覽器紀錄，沒有啟用時永遠不會存下紀錄
+        """
+        trace = Trace(name, self.threshold if self.enabled else None)
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+            if trace.should_save:
+                try:
+                    self.save(trace)
+                except OSError as e:
+                    logger.error(f"儲存慢速操作紀錄時發生錯誤: {e}")
+
+    def save(self, trace):
+        """把追蹤紀錄寫進環狀緩衝區，並刪掉超過容量的舊紀錄"""
+        elapsed = trace.elapsed
+        with self._lock:
+            self._count += 1
+            capture_dir = self.trace_dir / f"{trace.started_at.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._count}"
+        capture_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(capture_dir / "spans.json", "w") as f:
+            json.dump({
+                "name": trace.name,
+                "started_at": trace.started_at.isoformat(),
+                "elapsed": round(elapsed, 3),
+                "threshold": trace.threshold,
+                "violation": trace.violation,
+                "spans": trace.spans,
+            }, f, ensure_ascii=False, indent=2)
+        if trace.network:
+            with open(capture_dir / "network.json", "w") as f:
+                json.dump(trace.network, f)
+        if trace.trace_events:
+            with open(capture_dir / "trace.json", "w") as f:
+                json.dump({"traceEvents": trace.trace_events}, f)
+        if trace.screenshot:
+            (capture_dir / "screenshot.png").write_bytes(trace.screenshot)
+        if trace.page_source:
+            (capture_dir / "page.html").write_text(trace.page_source, encoding="utf-8")
+
+        if trace.violation:
+            logger.warning(f"{trace.name} 被強制結束（{trace.violation}），紀錄存放在 {capture_dir}")
+        else:
+            logger.warning(f"{trace.name} 花了 {elapsed:.1f} 秒，超過 {trace.threshold} 秒，紀錄存放在 {capture_dir}")
+        self._evict(keep=capture_dir)
+
+    def _evict(self, keep):
+        """從最舊的紀錄開始刪，直到總大小不超過上限"""
+        with self._lock:
+            captures = []
+            for path in self.trace_dir.iterdir():
+                if path.is_dir():
+                    size = sum(f.stat().st_size for f in path.iterdir())
+                    captures.append((path.stat().st_mtime, path, size))
+            captures.sort()
+
+            total = sum(size for _, _, size in captures)
+            for _, path, size in captures:
+                if total <= self.max_bytes:
+                    break
+                # 最新的紀錄就算自己超過上限也保留
+                if path == keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# 程式碼以 src/autoauth 為工作目錄執行，模組之間直接 import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "autoauth"))
+
+# 避免 import main 時把紀錄寫到目前目錄
+os.environ.setdefault("RECORD_DIR", tempfile.mkdtemp(prefix="autoauth-test-record-"))
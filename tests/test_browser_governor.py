@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+
+import pytest
+
+import browser_governor
+from browser_governor import (
+    BrowserGovernor, PROFILE_PREFIX, get_profile_dir, get_profile_owner, kill_processes
+)
+from exceptions import BrowserResourceError
+
+
+def test_get_profile_dir_matches_only_governor_profiles():
+    profile_dir = str(Path(tempfile.gettempdir()) / f"{PROFILE_PREFIX}1234-abcd")
+
+    assert get_profile_dir(["chrome", "--headless", f"--user-data-dir={profile_dir}"]) == profile_dir
+    assert get_profile_dir(["chrome", "--user-data-dir=/home/user/.config/google-chrome"]) is None
+    assert get_profile_dir(["chrome", f"--user-data-dir=/home/user/{PROFILE_PREFIX}1234-abcd"]) is None
+    assert get_profile_dir(["chrome"]) is None
+    assert get_profile_owner(profile_dir) == 1234
+
+
+def test_before_kill_runs_when_action_times_out():
+    governor = BrowserGovernor(max_action_seconds=0, poll_interval=0.01)
+    reasons = []
+
+    with pytest.raises(BrowserResourceError):
+        with governor.action("簽到/簽退", before_kill=reasons.append):
+            time.sleep(0.1)
+
+    assert reasons == ["簽到/簽退 執行超過 0 秒"]
+
+
+def test_kill_processes_reaps_killed_children():
+    children = [subprocess.Popen(["sleep", "60"]) for _ in range(5)]
+
+    kill_processes({child.pid for child in children})
+
+    for child in children:
+        # 已經被回收的行程不會留下殭屍，pid 也查不到
+        assert not (Path("/proc") / str(child.pid)).exists()
+
+
+def test_reap_orphans_keeps_profiles_created_during_scan(monkeypatch):
+    governor = BrowserGovernor()
+    created = []
+
+    def process_table_while_another_thread_launches():
+        # 掃描 /proc 途中另一個執行緒建立了新的 profile
+        created.append(governor.new_profile_dir())
+        return {}
+
+    stale = tempfile.mkdtemp(prefix=f"{PROFILE_PREFIX}{os.getpid()}-")
+    monkeypatch.setattr(browser_governor, "read_process_table", process_table_while_another_thread_launches)
+    try:
+        governor.reap_orphans()
+
+        assert not Path(stale).exists()
+        assert Path(created[0]).is_dir()
+    finally:
+        for profile_dir in created:
+            shutil.rmtree(profile_dir, ignore_errors=True)
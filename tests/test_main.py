@@ -0,0 +1,132 @@
+from datetime import date, datetime
+
+import pytest
+
+from clock import VirtualClock, SimulationFinished
+from exceptions import AttendanceException, CredentialsError
+from main import (
+    MAX_SIGN_IN_ATTEMPTS, auto_check_in_out, get_retry_delay, get_total_hours, record_attendance
+)
+
+
+def run_scheduler(tmp_path, start, end, daily_work_hours=4):
+    clock = VirtualClock(start, end)
+    actions = []
+
+    def sign_action(action, day):
+        actions.append((action, clock.now()))
+
+    try:
+        auto_check_in_out(check_in_hour=9, daily_work_hours=daily_work_hours, clock=clock,
+                          sign_action=sign_action, record_dir=tmp_path,
+                          holiday_source=lambda start_date, end_date: set())
+    except SimulationFinished:
+        pass
+    return actions
+
+
+def test_late_start_does_not_sign_out_next_day(tmp_path):
+    actions = run_scheduler(tmp_path, datetime(2025, 3, 4, 23, 0), datetime(2025, 3, 6))
+
+    assert actions == [
+        ("SignIn", datetime(2025, 3, 5, 9, 0)),
+        ("SignOut", datetime(2025, 3, 5, 13, 0)),
+    ]
+
+
+def test_start_during_the_day_signs_in_immediately(tmp_path):
+    actions = run_scheduler(tmp_path, datetime(2025, 3, 4, 14, 0), datetime(2025, 3, 5))
+
+    assert actions == [
+        ("SignIn", datetime(2025, 3, 4, 14, 0)),
+        ("SignOut", datetime(2025, 3, 4, 18, 0)),
+    ]
+
+
+def test_sign_in_failures_back_off_and_give_up_for_the_day(tmp_path):
+    clock = VirtualClock(datetime(2025, 3, 4, 9, 0), datetime(2025, 3, 5))
+    attempts = []
+
+    def sign_action(action, day):
+        attempts.append(clock.now())
+        raise AttendanceException("登入失敗")
+
+    try:
+        auto_check_in_out(check_in_hour=9, daily_work_hours=4, clock=clock,
+                          sign_action=sign_action, record_dir=tmp_path,
+                          holiday_source=lambda start_date, end_date: set())
+    except SimulationFinished:
+        pass
+
+    assert len(attempts) == MAX_SIGN_IN_ATTEMPTS
+    gaps = [(later - earlier).total_seconds() for earlier, later in zip(attempts, attempts[1:])]
+    assert gaps == [get_retry_delay(i) for i in range(1, MAX_SIGN_IN_ATTEMPTS)]
+    assert gaps == sorted(gaps)
+
+
+def test_sign_in_done_by_another_worker_uses_recorded_time(tmp_path):
+    record_attendance("SignIn", datetime(2025, 3, 4, 9, 0), tmp_path)
+    clock = VirtualClock(datetime(2025, 3, 4, 10, 30), datetime(2025, 3, 5))
+    actions = []
+
+    def sign_action(action, day):
+        actions.append((action, clock.now()))
+        # 換手前的 worker 已經簽到過
+        return False if action == "SignIn" else None
+
+    try:
+        auto_check_in_out(check_in_hour=9, daily_work_hours=4, clock=clock,
+                          sign_action=sign_action, record_dir=tmp_path,
+                          holiday_source=lambda start_date, end_date: set())
+    except SimulationFinished:
+        pass
+
+    assert actions == [
+        ("SignIn", datetime(2025, 3, 4, 10, 30)),
+        ("SignOut", datetime(2025, 3, 4, 13, 0)),
+    ]
+    assert get_total_hours(date(2025, 3, 1), today=date(2025, 3, 4), record_dir=tmp_path) == 4
+
+
+def test_credentials_error_stops_the_scheduler(tmp_path):
+    clock = VirtualClock(datetime(2025, 3, 4, 9, 0), datetime(2025, 3, 5))
+    attempts = []
+
+    def sign_action(action, day):
+        attempts.append(clock.now())
+        raise CredentialsError("請在 .env 檔案中設定 NYCU_USERNAME 和 NYCU_PASSWORD")
+
+    with pytest.raises(CredentialsError):
+        auto_check_in_out(check_in_hour=9, daily_work_hours=4, clock=clock,
+                          sign_action=sign_action, record_dir=tmp_path,
+                          holiday_source=lambda start_date, end_date: set())
+    assert len(attempts) == 1
+
+
+def test_provisional_plan_is_rebuilt_the_next_day(tmp_path):
+    clock = VirtualClock(datetime(2025, 3, 4, 10, 0), datetime(2025, 3, 7))
+    actions = []
+    fetches = []
+
+    def sign_action(action, day):
+        actions.append((action, clock.now()))
+
+    def holiday_source(start_date, end_date):
+        fetches.append(clock.now())
+        # 第一次取得行事曆失敗，之後才知道 3/5 放假
+        return None if len(fetches) == 1 else {date(2025, 3, 5)}
+
+    try:
+        auto_check_in_out(check_in_hour=9, daily_work_hours=4, clock=clock,
+                          sign_action=sign_action, record_dir=tmp_path,
+                          holiday_source=holiday_source)
+    except SimulationFinished:
+        pass
+
+    assert [fetched.date() for fetched in fetches] == [date(2025, 3, 4), date(2025, 3, 5)]
+    assert actions == [
+        ("SignIn", datetime(2025, 3, 4, 10, 0)),
+        ("SignOut", datetime(2025, 3, 4, 14, 0)),
+        ("SignIn", datetime(2025, 3, 6, 9, 0)),
+        ("SignOut", datetime(2025, 3, 6, 13, 0)),
+    ]
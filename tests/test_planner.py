@@ -0,0 +1,107 @@
+from datetime import date, datetime
+
+import pytest
+
+import planner
+from planner import MonthlyPlan, build_monthly_plan, get_next_period_start, get_period_holidays
+
+
+@pytest.fixture
+def january_plan():
+    # 2025/1/1 (三) 放假，其餘周一到周五都是工作日，共 22 天
+    return MonthlyPlan(date(2025, 1, 1), date(2025, 1, 31), {date(2025, 1, 1)},
+                       required_hours=20, daily_work_hours=8, check_in_hour=9)
+
+
+@pytest.mark.parametrize("start_date, start_day, expected", [
+    (date(2025, 1, 1), 1, date(2025, 2, 1)),
+    (date(2025, 1, 29), 29, date(2025, 2, 28)),
+    (date(2024, 1, 29), 29, date(2024, 2, 29)),
+    (date(2025, 1, 30), 30, date(2025, 2, 28)),
+    (date(2025, 2, 28), 30, date(2025, 3, 30)),
+    (date(2025, 1, 31), 31, date(2025, 2, 28)),
+    (date(2025, 3, 31), 31, date(2025, 4, 30)),
+    (date(2025, 12, 31), 31, date(2026, 1, 31)),
+    (date(2025, 11, 30), 31, date(2025, 12, 31)),
+])
+def test_get_next_period_start(start_date, start_day, expected):
+    assert get_next_period_start(start_date, start_day) == expected
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2025, 1, 1), False),
+    (date(2025, 1, 2), True),
+    (date(2025, 1, 4), False),
+    (date(2025, 1, 31), True),
+    (date(2024, 12, 31), False),
+    (date(2025, 2, 3), False),
+])
+def test_is_workday(january_plan, day, expected):
+    assert january_plan.is_workday(day) is expected
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2024, 12, 1), 22),
+    (date(2025, 1, 1), 22),
+    (date(2025, 1, 2), 22),
+    (date(2025, 1, 4), 20),
+    (date(2025, 1, 30), 2),
+    (date(2025, 1, 31), 1),
+    (date(2025, 2, 1), 0),
+])
+def test_remaining_workdays(january_plan, day, expected):
+    assert january_plan.remaining_workdays(day) == expected
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2024, 12, 1), date(2025, 1, 2)),
+    (date(2024, 12, 31), date(2025, 1, 2)),
+    (date(2025, 1, 1), date(2025, 1, 2)),
+    (date(2025, 1, 3), date(2025, 1, 6)),
+    (date(2025, 1, 30), date(2025, 1, 31)),
+    (date(2025, 1, 31), None),
+    (date(2025, 2, 5), None),
+])
+def test_next_workday(january_plan, day, expected):
+    assert january_plan.next_workday(day) == expected
+
+
+@pytest.mark.parametrize("done_hours, from_day, today_hours, expected", [
+    (0, date(2025, 1, 2), 0, [(date(2025, 1, 2), 8), (date(2025, 1, 3), 8), (date(2025, 1, 6), 4)]),
+    (3, date(2025, 1, 2), 3, [(date(2025, 1, 2), 5), (date(2025, 1, 3), 8), (date(2025, 1, 6), 4)]),
+    (8, date(2025, 1, 2), 8, [(date(2025, 1, 3), 8), (date(2025, 1, 6), 4)]),
+    (0, date(2025, 1, 4), 0, [(date(2025, 1, 6), 8), (date(2025, 1, 7), 8), (date(2025, 1, 8), 4)]),
+    (0, date(2024, 12, 20), 0, [(date(2025, 1, 2), 8), (date(2025, 1, 3), 8), (date(2025, 1, 6), 4)]),
+    (0, date(2025, 1, 30), 0, [(date(2025, 1, 30), 8), (date(2025, 1, 31), 8)]),
+    (20, date(2025, 1, 2), 0, []),
+])
+def test_replan(january_plan, done_hours, from_day, today_hours, expected):
+    schedule = january_plan.replan(done_hours, from_day, today_hours)
+
+    assert [(slot.day, slot.hours) for slot in schedule] == expected
+    for slot in schedule:
+        assert slot.sign_in == datetime.combine(slot.day, datetime.min.time()).replace(hour=9)
+        assert january_plan.slot_for(slot.day) == slot
+
+
+def test_replan_is_complete(january_plan):
+    january_plan.replan(0, date(2025, 1, 30))
+    assert not january_plan.is_complete
+
+    january_plan.replan(20, date(2025, 1, 30))
+    assert january_plan.is_complete
+
+
+def test_failed_calendar_fetch_is_not_treated_as_no_holidays(monkeypatch):
+    monkeypatch.setattr(planner, "get_nycu_calendar_holidays", lambda year, month: None)
+
+    assert get_period_holidays(date(2025, 1, 15), date(2025, 2, 14)) is None
+
+
+def test_plan_without_holidays_is_provisional():
+    plan = build_monthly_plan(date(2025, 1, 1), 1, 20, holiday_source=lambda start_date, end_date: None)
+
+    assert plan.provisional
+    assert plan.is_workday(date(2025, 1, 1))
+    assert not build_monthly_plan(date(2025, 1, 1), 1, 20,
+                                  holiday_source=lambda start_date, end_date: set()).provisional
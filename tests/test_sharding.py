@@ -0,0 +1,163 @@
+import time
+
+from datetime import datetime
+
+import pytest
+
+import planner
+import sharding
+from clock import ClockStopped, SimulationFinished, VirtualClock
+from exceptions import LeaseLostError
+from main import record_attendance
+from sharding import LeaseStore, ShardWorker, owner_of
+
+ACCOUNTS = [{"username": f"user{i}", "password": "password", "check_in_hour": 9, "daily_work_hours": 4}
+            for i in range(30)]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return tmp_path / "shard.sqlite3"
+
+
+@pytest.fixture
+def idle_accounts(monkeypatch):
+    """帳號的排程只等待到被停止，不會真的開瀏覽器"""
+    def run_account(self, account, clock):
+        try:
+            clock.sleep(3600)
+        except ClockStopped:
+            pass
+
+    monkeypatch.setattr(ShardWorker, "_run_account", run_account)
+
+
+def event_status(store, account, event_key):
+    row = store.conn.execute(
+        "SELECT status FROM events WHERE account = ? AND event_key = ?", (account, event_key)
+    ).fetchone()
+    return row and row[0]
+
+
+def settle(workers, rounds=3):
+    """重複 rebalance，直到被停止的排程都結束、租約都交接完成"""
+    for _ in range(rounds):
+        for worker in workers:
+            worker.rebalance()
+            for thread, clock in list(worker._running.values()):
+                if clock.stopped:
+                    thread.join()
+
+
+def test_two_nodes_compete_for_one_account(store_path):
+    first, second = LeaseStore(store_path), LeaseStore(store_path)
+
+    assert first.acquire("node-a", "user0")
+    assert not second.acquire("node-b", "user0")
+    assert first.owned_accounts("node-a") == {"user0"}
+    assert second.owned_accounts("node-b") == set()
+    with pytest.raises(LeaseLostError):
+        second.claim_event("node-b", "user0", "2025-03-04:SignIn")
+
+
+def test_expired_lease_is_taken_over(store_path, monkeypatch):
+    first, second = LeaseStore(store_path, ttl=60), LeaseStore(store_path, ttl=60)
+    assert first.acquire("node-a", "user0")
+
+    now = time.time() + 61
+    monkeypatch.setattr(sharding.time, "time", lambda: now)
+
+    assert first.owned_accounts("node-a") == set()
+    assert second.acquire("node-b", "user0")
+    assert second.claim_event("node-b", "user0", "2025-03-04:SignIn")
+    with pytest.raises(LeaseLostError):
+        first.claim_event("node-a", "user0", "2025-03-04:SignOut")
+
+
+def test_claim_event_succeeds_once_and_marks_interrupted_event_unknown(store_path):
+    store = LeaseStore(store_path)
+    store.acquire("node-a", "user0")
+    event_key = "2025-03-04:SignIn"
+
+    assert store.claim_event("node-a", "user0", event_key)
+    assert event_status(store, "user0", event_key) == "running"
+
+    # 上一次認領停在執行中，不知道網站上是否已經簽到
+    assert not store.claim_event("node-a", "user0", event_key)
+    assert event_status(store, "user0", event_key) == "unknown"
+    assert not store.claim_event("node-a", "user0", event_key)
+
+
+def test_finish_event_retries_only_before_confirm(store_path):
+    store = LeaseStore(store_path)
+    store.acquire("node-a", "user0")
+
+    store.claim_event("node-a", "user0", "2025-03-04:SignIn")
+    store.finish_event("node-a", "user0", "2025-03-04:SignIn", success=False)
+    assert event_status(store, "user0", "2025-03-04:SignIn") is None
+    assert store.claim_event("node-a", "user0", "2025-03-04:SignIn")
+
+    store.claim_event("node-a", "user0", "2025-03-04:SignOut")
+    store.finish_event("node-a", "user0", "2025-03-04:SignOut", success=False, confirmed=True)
+    assert event_status(store, "user0", "2025-03-04:SignOut") == "unknown"
+    assert not store.claim_event("node-a", "user0", "2025-03-04:SignOut")
+
+
+def test_node_join_moves_only_its_accounts(store_path, idle_accounts):
+    workers = [ShardWorker(LeaseStore(store_path), node_id, ACCOUNTS) for node_id in ("node-a", "node-b")]
+    try:
+        settle(workers)
+        before = {account: (worker, clock) for worker in workers
+                  for account, (_, clock) in worker._running.items()}
+        assert set(before) == {account["username"] for account in ACCOUNTS}
+        for account, (worker, _) in before.items():
+            assert owner_of(account, ["node-a", "node-b"]) == worker.node_id
+
+        workers.append(ShardWorker(LeaseStore(store_path), "node-c", ACCOUNTS))
+        settle(workers)
+
+        moved = {account for account, (_, clock) in before.items() if clock.stopped}
+        nodes = ["node-a", "node-b", "node-c"]
+        assert moved
+        assert moved == set(workers[2]._running)
+        assert moved == {account for account in before if owner_of(account, nodes) == "node-c"}
+        for worker in workers:
+            assert worker.store.owned_accounts(worker.node_id) == set(worker._running)
+    finally:
+        for worker in workers:
+            worker.shutdown()
+
+
+@pytest.mark.parametrize("sign_out_status", ["unknown", "done"])
+def test_sign_out_not_done_by_this_worker_moves_on_to_tomorrow(store_path, tmp_path, monkeypatch, sign_out_status):
+    # unknown: 點擊確定後失敗或 worker 在簽退途中被砍掉；done: 完成後來不及寫紀錄就掛掉
+    store = LeaseStore(store_path)
+    store.acquire("node-a", "user0")
+    for event_key, status in (("2025-03-04:SignIn", "done"), ("2025-03-04:SignOut", sign_out_status)):
+        store.conn.execute(
+            "INSERT INTO events (account, event_key, node_id, status, updated) VALUES (?, ?, 'node-old', ?, ?)",
+            ("user0", event_key, status, time.time())
+        )
+    monkeypatch.setattr(sharding, "RECORD_DIR", tmp_path)
+    record_attendance("SignIn", datetime(2025, 3, 4, 9, 0), tmp_path / "user0")
+
+    claims = []
+    claim_event = store.claim_event
+
+    def counting_claim_event(*args):
+        claims.append(args[2])
+        # 沒有修正時排程會不停重新認領同一個事件
+        assert len(claims) < 10, claims
+        return claim_event(*args)
+
+    monkeypatch.setattr(store, "claim_event", counting_claim_event)
+    monkeypatch.setattr(planner, "get_period_holidays", lambda start_date, end_date: set())
+    signed = []
+    monkeypatch.setattr(sharding, "handle_singin_singout", lambda *args, **kwargs: signed.append(args))
+
+    worker = ShardWorker(store, "node-a", ACCOUNTS)
+    with pytest.raises(SimulationFinished):
+        worker._run_account(ACCOUNTS[0], VirtualClock(datetime(2025, 3, 4, 13, 0), datetime(2025, 3, 5, 9, 30)))
+
+    assert claims == ["2025-03-04:SignIn", "2025-03-04:SignOut", "2025-03-05:SignIn"]
+    assert len(signed) == 1
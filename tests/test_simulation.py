@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import pytest
+
+from clock import VirtualTimeline
+from main import MONTHLY_REQUIRED_HOURS, MONTHLY_START_DAY, record_attendance
+from simulation import get_period_starts, run_simulation, verify_account
+
+# 2025/1 的工作日，1/1 放假
+JANUARY_WORKDAYS = [date(2025, 1, day) for day in (2, 3, 6, 7, 8)]
+
+
+def test_timeline_interleaves_schedules_in_time_order():
+    timeline = VirtualTimeline(datetime(2025, 1, 1), datetime(2025, 1, 1, 1))
+    events = []
+
+    def schedule(name, interval):
+        def run(clock):
+            while True:
+                clock.sleep(interval)
+                events.append((clock.now().minute, name))
+        return run
+
+    timeline.spawn(schedule("a", 20 * 60))
+    timeline.spawn(schedule("b", 25 * 60))
+    timeline.run()
+
+    assert events == [(20, "a"), (25, "b"), (40, "a"), (50, "b")]
+
+
+def test_run_simulation_schedules_all_accounts_correctly():
+    result = run_simulation(accounts=3, year=2025, failure_rate=0.05)
+
+    assert result["failed_accounts"] == {}
+    assert result["sign_actions"] > 0
+
+
+@pytest.mark.parametrize("first, last, start_day, expected", [
+    (date(2025, 1, 1), date(2025, 3, 1), 1, [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]),
+    (date(2025, 1, 1), date(2025, 4, 1), 31, [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)]),
+    (date(2024, 1, 15), date(2024, 3, 31), 30, [date(2024, 1, 30), date(2024, 2, 29), date(2024, 3, 30)]),
+])
+def test_get_period_starts(first, last, start_day, expected):
+    assert get_period_starts(first, last, start_day) == expected
+
+
+def write_schedule(record_dir, days, hours=4):
+    for day in days:
+        sign_in = datetime(day.year, day.month, day.day, 9, 0)
+        record_attendance("SignIn", sign_in, record_dir)
+        record_attendance("SignOut", sign_in.replace(hour=9 + hours), record_dir)
+
+
+def verify_january(record_dir):
+    return verify_account(record_dir, {date(2025, 1, 1)}, datetime(2025, 1, 1), datetime(2025, 2, 1),
+                          check_in_hour=9, daily_work_hours=4)
+
+
+@pytest.mark.skipif(MONTHLY_START_DAY != 1 or MONTHLY_REQUIRED_HOURS != 20, reason="需要預設的每月設定")
+def test_verify_account_accepts_correct_schedule(tmp_path):
+    write_schedule(tmp_path, JANUARY_WORKDAYS)
+
+    assert verify_january(tmp_path) == []
+
+
+@pytest.mark.skipif(MONTHLY_START_DAY != 1 or MONTHLY_REQUIRED_HOURS != 20, reason="需要預設的每月設定")
+@pytest.mark.parametrize("days, error", [
+    # 假日簽到
+    ([date(2025, 1, 1)] + JANUARY_WORKDAYS[1:], "2025-01-01 不是工作日卻簽到"),
+    # 最後一天排到下個週期，本週期時數不足
+    (JANUARY_WORKDAYS[:4] + [date(2025, 2, 3)], "2025-01-01 ~ 2025-02-01 完成 16 小時，應為 20 小時"),
+    # 多排了一天
+    (JANUARY_WORKDAYS + [date(2025, 1, 9)], "2025-01-01 ~ 2025-02-01 完成 24 小時，應為 20 小時"),
+])
+def test_verify_account_flags_wrong_schedule(tmp_path, days, error):
+    write_schedule(tmp_path, days)
+
+    assert error in verify_january(tmp_path)
+
+
+def test_verify_account_flags_unpaired_records(tmp_path):
+    record_attendance("SignIn", datetime(2025, 1, 2, 9, 0), tmp_path)
+
+    assert verify_january(tmp_path)[0].startswith("紀錄未成對")
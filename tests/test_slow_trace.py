@@ -0,0 +1,38 @@
+import json
+
+from slow_trace import SlowTracer
+
+
+class FakeDriver:
+    page_source = "<html></html>"
+
+    def get_log(self, log_type):
+        return [{"message": json.dumps({"message": {"method": "Network.requestWillBeSent", "params": {}}})}]
+
+    def get_screenshot_as_png(self):
+        return b"png"
+
+
+def test_violation_collects_attached_driver_before_kill(tmp_path):
+    tracer = SlowTracer(threshold=3600, trace_dir=tmp_path)
+
+    with tracer.action("簽到/簽退") as trace:
+        # 登入失敗時 handle_singin_singout 拿不到 driver，只有啟動時登記的
+        tracer.attach(FakeDriver())
+        trace.on_violation("簽到/簽退 執行超過 300 秒")
+
+    [capture] = tmp_path.iterdir()
+    assert json.loads((capture / "spans.json").read_text())["violation"] == "簽到/簽退 執行超過 300 秒"
+    assert (capture / "network.json").exists()
+    assert (capture / "screenshot.png").read_bytes() == b"png"
+
+
+def test_disabled_tracer_saves_nothing(tmp_path):
+    tracer = SlowTracer(threshold=0, trace_dir=tmp_path)
+
+    with tracer.action("簽到/簽退") as trace:
+        tracer.attach(FakeDriver())
+        trace.on_violation("簽到/簽退 執行超過 300 秒")
+
+    assert not trace.network
+    assert list(tmp_path.iterdir()) == []